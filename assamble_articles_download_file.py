@@ -1,38 +1,41 @@
-import os
-import json
 import argparse
 import time
 
 from tqdm import tqdm
 
+from utility.record_io import iter_records, list_record_files
+from utility.url_frontier import QUEUE_DOWNLOAD, URLFrontier
+
 # Constants
 
 
-def extract_download_urls(directory, output_file):
-    # Collect all file paths in the directory
-    file_paths = [
-        os.path.join(directory, file)
-        for file in os.listdir(directory)
-        if os.path.isfile(os.path.join(directory, file))
-    ]
+def iter_download_urls(directory):
+    for file_path in tqdm(list_record_files(directory)):
+        try:
+            for item in iter_records(file_path):
+                url = item.get("url", "")
+                if url:
+                    yield url
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+
 
+def extract_download_urls(directory, output_file):
     with open(output_file, "w") as output:
-        for file_path in tqdm(file_paths):
-            try:
-                with open(file_path, "r") as json_file:
-                    data = json.load(json_file)
-                    # Extract URLs and write to the output file
-                    for item in data:
-                        url = item.get("url", "")
-                        if url:
-                            output.write(url + "\n")
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}")
+        for url in iter_download_urls(directory):
+            output.write(url + "\n")
+
+
+def enqueue_download_urls(directory, frontier_path):
+    frontier = URLFrontier(frontier_path)
+    added = frontier.add_many(iter_download_urls(directory), QUEUE_DOWNLOAD)
+    print(f"Queued {added} new download URLs.")
+    frontier.close()
 
 
 def get_args():
     parser = argparse.ArgumentParser(
-        description="Extract download URLs from a directory containing JSON files"
+        description="Extract download URLs from a directory containing JSON or JSONL files"
     )
 
     parser.add_argument(
@@ -51,6 +54,14 @@ def get_args():
         help="Path to the output file",
     )
 
+    parser.add_argument(
+        "--frontier",
+        "-f",
+        type=str,
+        default=None,
+        help="Queue the URLs in this URL frontier instead of writing a file",
+    )
+
     return parser.parse_args()
 
 
@@ -58,6 +69,10 @@ def main(args):
     DIRECTORY_PATH = args.directory
     OUTPUT_FILE = args.output
 
+    if args.frontier:
+        enqueue_download_urls(DIRECTORY_PATH, args.frontier)
+        return
+
     extract_download_urls(DIRECTORY_PATH, OUTPUT_FILE)
 
 
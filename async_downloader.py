@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+
+import aiohttp
+
+from downloader import URLDownloader, HTTPStatusError
+from utility.retry_policy import parse_retry_after
+from utility.url_frontier import QUEUE_DOWNLOAD
+
+
+class AsyncURLDownloader(URLDownloader):
+    """
+    asyncio flavour of URLDownloader. Instead of a fixed thread pool it runs
+    `concurrency` coroutines over a single aiohttp session, so thousands of
+    requests can be in flight across the loaded proxies at once. Retry,
+    backoff and randomized delay behave the same as in the threaded engine;
+    a coroutine waiting out a backoff costs nothing, so retries simply sleep
+    and go out again through a different proxy.
+    """
+
+    def __init__(
+        self,
+        url_list,
+        download_dir,
+        concurrency=1000,
+        max_retries=3,
+        retry_backoff=0.5,
+        randomized_delay=True,
+        chunk_size=64 * 1024,
+        max_size=None,
+        manifest_path=None,
+        max_backoff=60.0,
+        timeout=60,
+        max_in_flight=None,
+        content_addressed=False,
+        frontier=None,
+        frontier_queue=QUEUE_DOWNLOAD,
+    ):
+        super().__init__(
+            url_list,
+            download_dir,
+            max_workers=concurrency,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            randomized_delay=randomized_delay,
+            chunk_size=chunk_size,
+            max_size=max_size,
+            manifest_path=manifest_path,
+            max_backoff=max_backoff,
+            max_in_flight=max_in_flight,
+            content_addressed=content_addressed,
+            frontier=frontier,
+            frontier_queue=frontier_queue,
+        )
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    async def _stream_to_temp_file(self, response):
+        self._check_content_length(response.headers)
+
+        temp_file = self._create_temp_file()
+        digest = hashlib.sha256()
+        try:
+            size = 0
+            with temp_file:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    size += len(chunk)
+                    self._check_size(size)
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+
+        return temp_file.name, size, digest.hexdigest()
+
+    async def download_url(
+        self,
+        session,
+        url,
+        random_delay_min=0.1,
+        random_delay_max=0.69,
+    ):
+        failed_attempts = 0
+        last_proxy = None
+        while True:
+            try:
+                if self.randomized_delay:
+                    await asyncio.sleep(
+                        random.uniform(random_delay_min, random_delay_max)
+                    )
+
+                proxy = None
+                proxy_url = None
+                if self.request_tool.proxies:
+                    exclude = [last_proxy] if last_proxy is not None else None
+                    proxy = self.request_tool.get_proxy(exclude)
+                    proxy_url = proxy.to_url()
+
+                delay = self.request_tool.rate_limit_delay(url, proxy)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                start_time = time.time()
+                try:
+                    response = await session.get(url, proxy=proxy_url)
+                except Exception:
+                    if proxy is not None:
+                        self.request_tool.report(proxy, None, time.time() - start_time)
+                    raise
+
+                if proxy is not None:
+                    self.request_tool.report(
+                        proxy, response.status, time.time() - start_time
+                    )
+
+                async with response:
+                    if response.status != 200:
+                        raise HTTPStatusError(
+                            response.status,
+                            parse_retry_after(response.headers.get("Retry-After")),
+                        )
+
+                    content_type = response.headers.get("Content-Type")
+                    extension = self._get_extension(content_type)
+
+                    temp_name, size, sha256 = await self._stream_to_temp_file(
+                        response
+                    )
+
+                file_name = self._store_file(temp_name, url, extension, sha256)
+                self._record_success(url, size, content_type, file_name, sha256)
+                print(f"Downloaded {url}")
+                self._update_progress()
+                return
+            except Exception as e:
+                failed_attempts += 1
+                delay = self._handle_failure(url, e, failed_attempts)
+                if delay is None:
+                    return
+
+                last_proxy = proxy
+                await asyncio.sleep(delay)
+
+    async def _worker(self, session, queue):
+        while True:
+            url = await queue.get()
+            try:
+                if url is None:
+                    return
+                await self.download_url(session, url)
+            finally:
+                queue.task_done()
+
+    async def _run(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=0)
+        # No total limit, a large file on a slow proxy may take longer than
+        # that as long as its body keeps arriving
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeout, sock_read=self.timeout
+        )
+
+        # Keep the queue bounded so workers are fed without materialising a
+        # task object per URL
+        queue = asyncio.Queue(maxsize=self.max_in_flight)
+
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            workers = [
+                asyncio.create_task(self._worker(session, queue))
+                for _ in range(self.concurrency)
+            ]
+
+            for url in self._pending_urls():
+                await queue.put(url)
+
+            for _ in workers:
+                await queue.put(None)
+
+            await asyncio.gather(*workers)
+
+    def start_download(self):
+        try:
+            asyncio.run(self._run())
+        except KeyboardInterrupt:
+            print("Download interrupted by user. Exiting...")
+            return
+
+        if self.skipped_count > 0:
+            print(f"Skipped {self.skipped_count} URLs already downloaded.")
@@ -1,13 +1,18 @@
 import os
-import json
-import glob
+import itertools
 import multiprocessing
 
-from datetime import datetime
+from collections import deque
 from tqdm import tqdm
-from typing import List
+from typing import Iterable
 from lingua import Language, LanguageDetectorBuilder
 
+from utility.record_io import (
+    BatchedRecordWriter,
+    DEFAULT_RECORD_FORMAT,
+    iter_records_in_dir,
+)
+
 
 class Article:
     def __init__(self, title, info_url, abstract, language):
@@ -38,7 +43,19 @@ class Article:
 
 LANGAUGES = [Language.ENGLISH, Language.TURKISH, Language.AZERBAIJANI]
 
-detector = LanguageDetectorBuilder.from_languages(*LANGAUGES).build()
+# Built once per process by `init_detector`, not at import time
+detector = None
+
+
+def init_detector(threads=None):
+    global detector
+
+    # lingua parallelises batches with its own thread pool, keep the pools of
+    # all worker processes together within the available cores
+    if threads:
+        os.environ.setdefault("RAYON_NUM_THREADS", str(threads))
+
+    detector = LanguageDetectorBuilder.from_languages(*LANGAUGES).build()
 
 
 def language_object_to_string(language):
@@ -49,6 +66,9 @@ def language_object_to_string(language):
 
 
 def detect_language(article: Article):
+    if detector is None:
+        init_detector()
+
     language = detector.detect_language_of(article.title)
 
     article.language = language_object_to_string(language)
@@ -59,66 +79,85 @@ def detect_language(article: Article):
     return article
 
 
+def detect_languages_of_titles(titles):
+    if detector is None:
+        init_detector()
+
+    titles = [title or "" for title in titles]
+
+    if hasattr(detector, "detect_languages_in_parallel_of"):
+        languages = detector.detect_languages_in_parallel_of(titles)
+    else:
+        languages = [detector.detect_language_of(title) for title in titles]
+
+    return [language_object_to_string(language) for language in languages]
+
+
+def iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class LanguageProcessor:
-    def __init__(self, output_dir):
+    def __init__(
+        self,
+        output_dir,
+        workers=None,
+        chunk_size=1000,
+        output_format=DEFAULT_RECORD_FORMAT,
+    ):
         self.output_dir = output_dir
-
-    def save_articles_to_json(self, articles, filename):
-        with open(filename, "w", encoding="utf-8") as file:
-            # Convert each Article object to its dictionary representation
-            articles_dict = [article.to_dict() for article in articles]
-            # Write the list of dictionaries to the file in JSON format
-            json.dump(articles_dict, file, ensure_ascii=False, indent=4)
-
-    def process(self, articles: List[Article], batch_size=100):
-        # Create a pool of workers
-        pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-
-        # Asynchronously apply `process_file` to each filepath
-        results = [
-            pool.apply_async(detect_language, (article,)) for article in articles
-        ]
-
-        pool.close()  # No more tasks will be submitted to the pool
-
-        # Initialize progress bar
-        pbar = tqdm(total=len(articles))
-
-        # Collect results and update progress bar
-        temp_processed_articles = []
-        for result in results:
-            articles = result.get()  # Wait for the result
-            temp_processed_articles.append(articles)
-            pbar.update(1)  # Update progress bar
-
-            if len(temp_processed_articles) >= batch_size:
-                self.save_articles_to_json(
-                    temp_processed_articles,
-                    os.path.join(
-                        self.output_dir,
-                        f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                    ),
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.output_format = output_format
+
+    def process(self, articles: Iterable[Article], batch_size=100):
+        threads_per_worker = max(1, multiprocessing.cpu_count() // self.workers)
+
+        # Only a couple of chunks per worker are in flight at any time, so the
+        # input is consumed as fast as it is written out and never held whole
+        max_pending = self.workers * 2
+        pending = deque()
+
+        pbar = tqdm(unit="article")
+
+        def write_oldest(writer):
+            chunk, result = pending.popleft()
+            for article, language in zip(chunk, result.get()):
+                article.language = language
+                writer.write(article.to_dict())
+            pbar.update(len(chunk))
+
+        with BatchedRecordWriter(
+            self.output_dir, batch_size, self.output_format
+        ) as writer, multiprocessing.Pool(
+            processes=self.workers,
+            initializer=init_detector,
+            initargs=(threads_per_worker,),
+        ) as pool:
+            for chunk in iter_chunks(articles, self.chunk_size):
+                # Only the titles travel to the workers
+                titles = [article.title for article in chunk]
+                pending.append(
+                    (chunk, pool.apply_async(detect_languages_of_titles, (titles,)))
                 )
-                temp_processed_articles = []
 
-        # Save the remaining articles
-        if len(temp_processed_articles) > 0:
-            self.save_articles_to_json(
-                temp_processed_articles,
-                os.path.join(
-                    self.output_dir,
-                    f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                ),
-            )
+                if len(pending) >= max_pending:
+                    write_oldest(writer)
 
+            while pending:
+                write_oldest(writer)
 
-def read_articles_from_json(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        return [Article.from_dict(article) for article in json.load(file)]
+        pbar.close()
 
 
-def get_all_json_files_in_dir(dir_path):
-    return glob.glob(os.path.join(dir_path, "*.json"))
+def read_articles_from_dir(dir_path):
+    for article in iter_records_in_dir(dir_path):
+        yield Article.from_dict(article)
 
 
 def makedirsifnotexists(dir_path):
@@ -130,14 +169,15 @@ def main():
     SOURCE_DIR = "dergipark_articles"
     OUTPUT_DIR = "dergipark_articles_with_language"
     BATCH_SIZE = 50000
+    WORKERS = max(1, multiprocessing.cpu_count() // 4)
+    CHUNK_SIZE = 1000
+    OUTPUT_FORMAT = DEFAULT_RECORD_FORMAT
 
     makedirsifnotexists(OUTPUT_DIR)
 
-    articles = []
-    for file_path in get_all_json_files_in_dir(SOURCE_DIR):
-        articles.extend(read_articles_from_json(file_path))
+    articles = read_articles_from_dir(SOURCE_DIR)
 
-    processor = LanguageProcessor(OUTPUT_DIR)
+    processor = LanguageProcessor(OUTPUT_DIR, WORKERS, CHUNK_SIZE, OUTPUT_FORMAT)
 
     processor.process(articles, BATCH_SIZE)
 
@@ -1,15 +1,22 @@
 import os
 import re
 import time
+import heapq
 import random
+import hashlib
 import argparse
+import threading
+import tempfile
 import mimetypes
 import unicodedata
 
-from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from utility.request_tool import RequestTool
+from utility.content_store import ContentStore
+from utility.download_manifest import DEFAULT_MANIFEST_NAME, DownloadManifest
+from utility.retry_policy import RetryPolicy, parse_retry_after
+from utility.url_frontier import QUEUE_DOWNLOAD, QUEUE_INFO, QUEUE_SEARCH, URLFrontier
 
 
 def slugify(value, allow_unicode=False):
@@ -33,6 +40,17 @@ def slugify(value, allow_unicode=False):
     return re.sub(r"[-\s]+", "-", value).strip("-_")
 
 
+class DownloadTooLarge(Exception):
+    pass
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP Error: {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
 class URLDownloader:
     def __init__(
         self,
@@ -42,19 +60,47 @@ class URLDownloader:
         max_retries=3,
         retry_backoff=0.5,
         randomized_delay=True,
+        chunk_size=64 * 1024,
+        max_size=None,
+        manifest_path=None,
+        max_backoff=60.0,
+        max_in_flight=None,
+        content_addressed=False,
+        frontier=None,
+        frontier_queue=QUEUE_DOWNLOAD,
     ):
         self.url_list = url_list
         self.download_dir = download_dir
         self.downloaded_count = 0
+        self.progress_lock = threading.Lock()
         self.max_workers = max_workers
         self.max_retries = max_retries
         self.retry_backoff = retry_backoff
+        self.retry_policy = RetryPolicy(max_retries, retry_backoff, max_backoff)
         self.randomized_delay = randomized_delay
+        self.chunk_size = chunk_size
+        self.max_size = max_size
 
-        self.total_urls = len(url_list)
+        # Unknown when the URLs come from a lazy iterator
+        self.total_urls = len(url_list) if hasattr(url_list, "__len__") else None
+        self.skipped_count = 0
+        self.max_in_flight = max_in_flight or max_workers * 4
         if not os.path.exists(download_dir):
             os.makedirs(download_dir)
 
+        if manifest_path is None:
+            manifest_path = os.path.join(download_dir, DEFAULT_MANIFEST_NAME)
+        self.manifest = DownloadManifest(manifest_path)
+
+        # Files are stored by content hash instead of by slugified URL
+        self.content_store = None
+        if content_addressed:
+            self.content_store = ContentStore(os.path.join(download_dir, "objects"))
+
+        # When the URLs come from a frontier queue their state is kept there too
+        self.frontier = frontier
+        self.frontier_queue = frontier_queue
+
         self.request_tool = RequestTool()
 
     def _get_extension(self, content_type):
@@ -76,56 +122,238 @@ class URLDownloader:
             content_type, mimetypes.guess_extension(content_type) or ".txt"
         )
 
+    def _check_size(self, size):
+        if self.max_size is not None and size > self.max_size:
+            raise DownloadTooLarge(
+                f"Response body exceeds {self.max_size} bytes ({size} bytes)"
+            )
+
+    def _check_content_length(self, headers):
+        content_length = headers.get("Content-Length")
+        if content_length and content_length.isdigit():
+            self._check_size(int(content_length))
+
+    def _create_temp_file(self):
+        # Created next to the target so the final rename stays atomic
+        return tempfile.NamedTemporaryFile(
+            dir=self.download_dir, suffix=".part", delete=False
+        )
+
+    def _stream_to_temp_file(self, response):
+        """Writes the body to a temporary file, returns (path, size, sha256)."""
+        self._check_content_length(response.headers)
+
+        temp_file = self._create_temp_file()
+        digest = hashlib.sha256()
+        try:
+            size = 0
+            with temp_file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    size += len(chunk)
+                    self._check_size(size)
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+
+        return temp_file.name, size, digest.hexdigest()
+
+    def _store_file(self, temp_name, url, extension, sha256):
+        """
+        Moves a finished temporary file to its final place and returns that
+        path relative to the download directory.
+        """
+        try:
+            if self.content_store is not None:
+                file_name, is_new = self.content_store.put(temp_name, sha256, extension)
+                if not is_new:
+                    print(f"Content of {url} is already stored as {sha256}")
+            else:
+                file_name = os.path.join(
+                    self.download_dir, f"{slugify(url)}{extension}"
+                )
+                os.replace(temp_name, file_name)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+        return os.path.relpath(file_name, self.download_dir)
+
+    def _record_success(self, url, size, content_type, file_name, sha256):
+        self.manifest.record_success(url, size, content_type, file_name, sha256)
+        if self.frontier is not None:
+            self.frontier.mark_fetched(url, self.frontier_queue)
+
+    def _handle_failure(self, url, error, failed_attempts):
+        """
+        Records a failed attempt and returns how long to wait before the next
+        one, or None when the URL should not be retried.
+        """
+        self.manifest.record_failure(url)
+
+        if isinstance(error, DownloadTooLarge):
+            should_retry = False
+        else:
+            status_code = getattr(error, "status_code", None)
+            should_retry = self.retry_policy.should_retry(failed_attempts, status_code)
+
+        if not should_retry:
+            print(f"Failed to download {url} after {failed_attempts} attempts: {error}")
+            if self.frontier is not None:
+                self.frontier.mark_failed(url, self.frontier_queue)
+            return None
+
+        delay = self.retry_policy.get_delay(
+            failed_attempts, getattr(error, "retry_after", None)
+        )
+        print(
+            f"Error downloading {url}: {error}. Retrying in {delay:.2f}s... ({failed_attempts}/{self.max_retries})"
+        )
+        return delay
+
     def download_url(
         self,
         url,
-        retry_count=0,
+        failed_attempts=0,
+        last_proxy=None,
         random_delay_min=0.1,
         random_delay_max=0.69,
     ):
+        """
+        Makes a single attempt at `url`. On a retryable failure it returns a
+        (delay, failed_attempts, proxy) tuple so the caller can re-queue the
+        URL on a different proxy instead of blocking this worker in a sleep.
+        """
+        proxy = None
         try:
             if self.randomized_delay:
                 time.sleep(random.uniform(random_delay_min, random_delay_max))
 
-            response = self.request_tool.get(url)
+            if self.request_tool.proxies:
+                exclude = [last_proxy] if last_proxy is not None else None
+                proxy = self.request_tool.get_proxy(exclude)
+
+            response = self.request_tool.get(url, proxy=proxy, stream=True)
+            if response is None:
+                raise Exception("No response received")
+
+            with response:
+                if response.status_code != 200:
+                    raise HTTPStatusError(
+                        response.status_code,
+                        parse_retry_after(response.headers.get("Retry-After")),
+                    )
 
-            if response.status_code == 200:
                 content_type = response.headers.get("Content-Type")
                 extension = self._get_extension(content_type)
 
-                file_name = os.path.join(
-                    self.download_dir, f"{slugify(url)}{extension}"
-                )
-
-                file = Path(file_name)
-                file.write_bytes(response.content)
+                temp_name, size, sha256 = self._stream_to_temp_file(response)
 
-                print(f"Downloaded {url}")
-                self._update_progress()
-            else:
-                raise Exception(f"HTTP Error: {response.status_code}")
+            file_name = self._store_file(temp_name, url, extension, sha256)
+            self._record_success(url, size, content_type, file_name, sha256)
+            print(f"Downloaded {url}")
+            self._update_progress()
         except Exception as e:
-            if retry_count < self.max_retries:
-                print(
-                    f"Error downloading {url}: {e}. Retrying... ({retry_count+1}/{self.max_retries})"
-                )
-                time.sleep(self.retry_backoff * retry_count)
-                self.download_url(url, retry_count + 1)
-            else:
-                print(f"Failed to download {url} after {self.max_retries} retries.")
+            failed_attempts += 1
+            delay = self._handle_failure(url, e, failed_attempts)
+            if delay is not None:
+                return delay, failed_attempts, proxy
+
+        return None
 
     def _update_progress(self):
-        self.downloaded_count += 1
-        progress = (self.downloaded_count / self.total_urls) * 100
-        print(f"Progress: {progress:.2f}%")
+        with self.progress_lock:
+            self.downloaded_count += 1
+            downloaded_count = self.downloaded_count
+
+        if self.total_urls:
+            progress = ((downloaded_count + self.skipped_count) / self.total_urls) * 100
+            print(f"Progress: {progress:.2f}%")
+        else:
+            print(f"Progress: {downloaded_count} downloaded")
+
+    def _pending_urls(self):
+        """Lazily yields the URLs that the manifest does not list as completed."""
+        for url in self.url_list:
+            if self.manifest.is_completed(url):
+                self.skipped_count += 1
+                if self.frontier is not None:
+                    self.frontier.mark_fetched(url, self.frontier_queue)
+                continue
+            yield url
 
     def start_download(self):
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            try:
-                executor.map(self.download_url, self.url_list)
-            except KeyboardInterrupt:
-                print("Download interrupted by user. Exiting...")
-                executor.shutdown(wait=False)
+        urls = self._pending_urls()
+
+        # Retries wait here, ordered by the time they become due
+        retry_queue = []
+        retry_sequence = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            # At most max_in_flight URLs are running or waiting on a retry,
+            # new URLs are pulled from the iterator as earlier ones finish, so
+            # a host asking to back off is not sent fresh URLs meanwhile
+            pending = {}
+            exhausted = False
+
+            while True:
+                now = time.monotonic()
+                while retry_queue and retry_queue[0][0] <= now:
+                    _, _, url, failed_attempts, proxy = heapq.heappop(retry_queue)
+                    future = executor.submit(
+                        self.download_url, url, failed_attempts, proxy
+                    )
+                    pending[future] = url
+
+                while (
+                    not exhausted
+                    and len(pending) + len(retry_queue) < self.max_in_flight
+                ):
+                    url = next(urls, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    pending[executor.submit(self.download_url, url)] = url
+
+                if not pending and not retry_queue:
+                    break
+
+                timeout = retry_queue[0][0] - now if retry_queue else None
+                if not pending:
+                    time.sleep(timeout)
+                    continue
+
+                done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    retry = future.result()
+                    if retry is None:
+                        continue
+
+                    delay, failed_attempts, proxy = retry
+                    retry_sequence += 1
+                    heapq.heappush(
+                        retry_queue,
+                        (
+                            time.monotonic() + delay,
+                            retry_sequence,
+                            url,
+                            failed_attempts,
+                            proxy,
+                        ),
+                    )
+
+            if self.skipped_count > 0:
+                print(f"Skipped {self.skipped_count} URLs already downloaded.")
+        except KeyboardInterrupt:
+            print("Download interrupted by user. Exiting...")
+            executor.shutdown(wait=False, cancel_futures=True)
+            return
+
+        executor.shutdown()
 
 
 def read_url_list(file_path):
@@ -133,6 +361,14 @@ def read_url_list(file_path):
         return [line.strip() for line in file]
 
 
+def iter_url_list(file_path):
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            url = line.strip()
+            if url:
+                yield url
+
+
 def main(args):
     # Constants
     PROXY_FILE = args.proxy
@@ -141,17 +377,79 @@ def main(args):
     MAX_WORKERS = args.max_workers
     MAX_RETRIES = args.max_retries
     RETRY_BACKOFF = args.retry_backoff
+    MAX_BACKOFF = args.max_backoff
     RANDOMIZED_DELAY = args.randomized_delay
+    POOL_CONNECTIONS = args.pool_connections
+    POOL_SIZE = args.pool_size
+    CHUNK_SIZE = args.chunk_size
+    MAX_SIZE = args.max_size_mb * 1024 * 1024 if args.max_size_mb else None
+    MANIFEST_PATH = args.manifest
 
     request_tool = RequestTool()
+    request_tool.configure_pool(POOL_CONNECTIONS, POOL_SIZE)
+    request_tool.configure_rate_limit(
+        host_rate=args.host_rate, proxy_rate=args.proxy_rate, burst=args.burst
+    )
     request_tool.read_from_proxy_file(PROXY_FILE)
 
-    url_list = read_url_list(URL_LIST_FILE)
-    downloader = URLDownloader(
-        url_list, DOWNLOAD_DIR, MAX_WORKERS, MAX_RETRIES, RETRY_BACKOFF, RETRY_BACKOFF
-    )
+    frontier = None
+    if args.frontier:
+        frontier = URLFrontier(args.frontier)
+        if args.retry_failed:
+            # The url list path retries failures through the manifest, a
+            # frontier only hands out queued urls
+            requeued = frontier.requeue_failed(args.frontier_queue)
+            print(f"Queued {requeued} failed URLs again.")
+        url_list = frontier.iter_queued(args.frontier_queue)
+    else:
+        url_list = iter_url_list(URL_LIST_FILE)
+
+    if args.engine == "async":
+        # Imported lazily so the threaded engine does not require aiohttp
+        from async_downloader import AsyncURLDownloader
+
+        downloader = AsyncURLDownloader(
+            url_list,
+            DOWNLOAD_DIR,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            max_retries=MAX_RETRIES,
+            retry_backoff=RETRY_BACKOFF,
+            randomized_delay=RANDOMIZED_DELAY,
+            chunk_size=CHUNK_SIZE,
+            max_size=MAX_SIZE,
+            manifest_path=MANIFEST_PATH,
+            max_backoff=MAX_BACKOFF,
+            max_in_flight=args.max_in_flight,
+            content_addressed=args.content_addressed,
+            frontier=frontier,
+            frontier_queue=args.frontier_queue,
+        )
+    else:
+        downloader = URLDownloader(
+            url_list,
+            DOWNLOAD_DIR,
+            max_workers=MAX_WORKERS,
+            max_retries=MAX_RETRIES,
+            retry_backoff=RETRY_BACKOFF,
+            randomized_delay=RANDOMIZED_DELAY,
+            chunk_size=CHUNK_SIZE,
+            max_size=MAX_SIZE,
+            manifest_path=MANIFEST_PATH,
+            max_backoff=MAX_BACKOFF,
+            max_in_flight=args.max_in_flight,
+            content_addressed=args.content_addressed,
+            frontier=frontier,
+            frontier_queue=args.frontier_queue,
+        )
     downloader.start_download()
 
+    if frontier is not None:
+        frontier.close()
+
+    for proxy_stats in request_tool.get_proxy_stats():
+        print(proxy_stats)
+
 
 def get_args():
     parser = argparse.ArgumentParser(description="Download files from an url list")
@@ -166,8 +464,8 @@ def get_args():
         "-u",
         "--url-list",
         type=str,
-        help="URL list file path",
-        required=True,
+        help="URL list file path, not needed when reading from a frontier",
+        default=None,
     )
     parser.add_argument(
         "-d",
@@ -194,17 +492,125 @@ def get_args():
         "-b",
         "--retry-backoff",
         type=float,
-        help="Retry backoff time in seconds",
+        help="Base of the exponential retry backoff in seconds",
         default=0.5,
     )
+    parser.add_argument(
+        "--max-backoff",
+        type=float,
+        help="Upper bound for a single retry backoff in seconds",
+        default=60.0,
+    )
     parser.add_argument(
         "-rd",
         "--randomized-delay",
         action="store_true",
         help="Add randomized delay between requests",
     )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        help="Maximum number of queued or running downloads, defaults to 4x workers",
+        default=None,
+    )
+    parser.add_argument(
+        "--content-addressed",
+        action="store_true",
+        help="Store files by SHA-256 under a sharded objects directory",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=["thread", "async"],
+        help="Download engine, a thread pool or an asyncio event loop",
+        default="thread",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        help="Maximum number of in-flight requests for the async engine",
+        default=1000,
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds the async engine waits to connect or for more of a body",
+        default=60.0,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Number of bytes written to disk at a time while streaming",
+        default=64 * 1024,
+    )
+    parser.add_argument(
+        "--max-size-mb",
+        type=int,
+        help="Abort downloads whose body is larger than this many megabytes",
+        default=None,
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        type=str,
+        help="Download manifest path, defaults to a file inside the download directory",
+        default=None,
+    )
+    parser.add_argument(
+        "--host-rate",
+        type=float,
+        help="Maximum requests per second sent to a single host",
+        default=None,
+    )
+    parser.add_argument(
+        "--proxy-rate",
+        type=float,
+        help="Maximum requests per second sent through a single proxy",
+        default=None,
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        help="Token bucket capacity, defaults to one second worth of requests",
+        default=None,
+    )
+    parser.add_argument(
+        "--pool-connections",
+        type=int,
+        help="Number of host connection pools kept per proxy session",
+        default=10,
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="Maximum number of keep-alive connections per host pool",
+        default=20,
+    )
+    parser.add_argument(
+        "--frontier",
+        type=str,
+        help="URL frontier database to read the queued URLs from",
+        default=None,
+    )
+    parser.add_argument(
+        "--frontier-queue",
+        type=str,
+        choices=[QUEUE_SEARCH, QUEUE_INFO, QUEUE_DOWNLOAD],
+        help="Frontier queue to download",
+        default=QUEUE_DOWNLOAD,
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Queue the frontier URLs that failed in earlier runs again",
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.url_list and not args.frontier:
+        parser.error("one of --url-list or --frontier is required")
+    return args
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+import argparse
+import os
+import time
+
+from tqdm import tqdm
+
+from utility.download_manifest import DEFAULT_MANIFEST_NAME, DownloadManifest
+from utility.parquet_writer import ArticleParquetWriter
+from utility.record_io import iter_records, list_record_files
+
+
+def load_pdf_urls(download_links_dir):
+    """
+    Maps article landing page file names, as produced by downloader.py, to
+    the PDF url extracted from them.
+    """
+    pdf_urls = {}
+    for file_path in list_record_files(download_links_dir):
+        for pair in iter_records(file_path):
+            pdf_urls[pair["filename"]] = pair["url"]
+    return pdf_urls
+
+
+def landing_file_name(manifest, info_url):
+    """
+    Name of the file downloader.py saved the landing page of `info_url` as.
+    Taken from its manifest, since the name depends on the content type and
+    on whether the content addressed store was used.
+    """
+    file_name = manifest.file_name(info_url)
+    return os.path.basename(file_name) if file_name else None
+
+
+def export_articles(
+    source_dir, output_file, pdf_urls, row_group_size, compression, manifest=None
+):
+    with ArticleParquetWriter(output_file, row_group_size, compression) as writer:
+        for file_path in tqdm(list_record_files(source_dir)):
+            for article in iter_records(file_path):
+                info_url = article.get("info_url")
+                if pdf_urls and manifest is not None and info_url:
+                    file_name = landing_file_name(manifest, info_url)
+                    article["pdf_url"] = pdf_urls.get(file_name) if file_name else None
+                writer.write(article)
+
+        return writer.count
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Export article records to a columnar Parquet file"
+    )
+
+    parser.add_argument(
+        "--source_dir",
+        "-s",
+        type=str,
+        default="dergipark_articles_turkish",
+        help="Directory containing the article record files",
+    )
+
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="dergipark_articles_turkish.parquet",
+        help="Path to the output Parquet file",
+    )
+
+    parser.add_argument(
+        "--download_links_dir",
+        "-d",
+        type=str,
+        default=None,
+        help="Directory of extracted download links, used to fill in pdf_url",
+    )
+
+    parser.add_argument(
+        "--landing_dir",
+        "-l",
+        type=str,
+        default=None,
+        help="Download directory of the landing pages the links were extracted from",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        "-m",
+        type=str,
+        default=None,
+        help="Landing page download manifest, defaults to the one in --landing_dir",
+    )
+
+    parser.add_argument(
+        "--row_group_size",
+        type=int,
+        default=100000,
+        help="Number of articles per Parquet row group",
+    )
+
+    parser.add_argument(
+        "--compression",
+        type=str,
+        default="zstd",
+        help="Parquet compression codec",
+    )
+
+    args = parser.parse_args()
+    if args.manifest is None and args.landing_dir:
+        args.manifest = os.path.join(args.landing_dir, DEFAULT_MANIFEST_NAME)
+    if args.download_links_dir and not args.manifest:
+        parser.error("--download_links_dir needs --landing_dir or --manifest")
+    if args.manifest and not os.path.exists(args.manifest):
+        parser.error(f"No download manifest at {args.manifest}")
+
+    return args
+
+
+def main(args):
+    pdf_urls = {}
+    manifest = None
+    if args.download_links_dir:
+        pdf_urls = load_pdf_urls(args.download_links_dir)
+        print(f"Loaded {len(pdf_urls)} download links.")
+        manifest = DownloadManifest(args.manifest)
+
+    count = export_articles(
+        args.source_dir,
+        args.output,
+        pdf_urls,
+        args.row_group_size,
+        args.compression,
+        manifest,
+    )
+    print(f"Exported {count} articles to {args.output}")
+
+    if manifest is not None:
+        manifest.close()
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+    args = get_args()
+    main(args)
+
+    print(f"Done in {time.time() - start_time} seconds")
@@ -1,28 +1,60 @@
 import multiprocessing
-import json
 import glob
+import html
 import os
+import re
 import time
 
 from bs4 import BeautifulSoup
 from tqdm import tqdm
-from datetime import datetime
+
+from utility.processed_file_index import (
+    DEFAULT_INDEX_NAME,
+    ProcessedFileIndex,
+    file_signature,
+)
+from utility.record_io import (
+    BatchedRecordWriter,
+    DEFAULT_RECORD_FORMAT,
+    RECORD_FORMATS,
+)
+
+# Everything needed lives in <head>, so pages are only read up to </head>
+HEAD_READ_CHUNK_SIZE = 16 * 1024
+HEAD_MAX_CHARS = 512 * 1024
+# Comments, scripts and styles are dropped before any tag is looked at, so
+# a commented out meta tag or a "<body" inside a script does not count
+NON_MARKUP_PATTERN = re.compile(
+    r"<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)",
+    re.IGNORECASE | re.DOTALL,
+)
+# Whole tags with quoted attribute values skipped, so a "<body" inside an
+# attribute is not mistaken for the start of the body
+TAG_PATTERN = re.compile(
+    r"<(/?)([a-zA-Z][^\s/>]*)(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"
+)
+
+META_TAG_PATTERN = re.compile(r"<meta\s(?:[^>\"']|\"[^\"]*\"|'[^']*')*>", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(
+    r"([^\s=/>]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))"
+)
 
 
 class ArticlePair:
-    def __init__(self, filename, url):
+    def __init__(self, filename, url, citation=None):
         self.filename = filename
         self.url = url
+        self.citation = citation or {}
 
     def to_dict(self):
-        return {"filename": self.filename, "url": self.url}
+        return {"filename": self.filename, "url": self.url, "citation": self.citation}
 
     def __str__(self) -> str:
         return f"{self.filename} ({self.url})"
 
     @classmethod
     def from_dict(cls, json):
-        return cls(json["filename"], json["url"])
+        return cls(json["filename"], json["url"], json.get("citation"))
 
 
 def sanitize(text):
@@ -41,10 +73,85 @@ def get_download_url(soup) -> ArticlePair:
     return None
 
 
+def strip_non_markup(text):
+    return NON_MARKUP_PATTERN.sub(" ", text)
+
+
+def find_head_end(text):
+    for match in TAG_PATTERN.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if (closing and name == "head") or (not closing and name == "body"):
+            return match.start()
+    return None
+
+
+def read_head(html_filepath):
+    """
+    Reads the file only until the end of <head>, or all of it when no end is
+    found. Returns the head with comments, scripts and styles removed.
+    """
+    raw = ""
+    head = ""
+    with open(html_filepath, encoding="utf-8") as file:
+        while len(raw) < HEAD_MAX_CHARS:
+            chunk = file.read(HEAD_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            # Cleaned again from the start, a comment or script may span
+            # two chunks
+            raw += chunk
+            head = strip_non_markup(raw)
+
+            end = find_head_end(head)
+            if end is not None:
+                return head[:end]
+
+    return head
+
+
+def parse_meta_attributes(tag):
+    attributes = {}
+    for match in ATTRIBUTE_PATTERN.finditer(tag[len("<meta") :]):
+        name = match.group(1).lower()
+        value = next(group for group in match.groups()[1:] if group is not None)
+        attributes[name] = html.unescape(value)
+    return attributes
+
+
+def get_citation_meta(head):
+    """Collects every citation_* meta tag, repeated names become lists."""
+    citation = {}
+    for tag in META_TAG_PATTERN.findall(head):
+        attributes = parse_meta_attributes(tag)
+
+        name = attributes.get("name")
+        if not name or not name.startswith("citation_") or "content" not in attributes:
+            continue
+
+        content = attributes["content"]
+        if name not in citation:
+            citation[name] = content
+        elif isinstance(citation[name], list):
+            citation[name].append(content)
+        else:
+            citation[name] = [citation[name], content]
+
+    return citation
+
+
 def extract_articlepair(html_filepath):
-    soup = BeautifulSoup(open(html_filepath, encoding="utf-8"), "html.parser")
+    head = read_head(html_filepath)
+
+    citation = get_citation_meta(head)
+    download_url = citation.get("citation_pdf_url")
+    if isinstance(download_url, list):
+        download_url = download_url[0]
 
-    download_url = get_download_url(soup)
+    if not download_url:
+        # Not in the head, or the head could not be told apart, parse all of it
+        soup = BeautifulSoup(open(html_filepath, encoding="utf-8"), "html.parser")
+        download_url = get_download_url(soup)
 
     if not download_url:
         print(f"Could not find download url for {html_filepath}")
@@ -52,66 +159,81 @@ def extract_articlepair(html_filepath):
 
     filename = os.path.basename(html_filepath)
 
-    return ArticlePair(filename, download_url)
+    return ArticlePair(filename, download_url, citation)
+
+
+def extract_articlepair_dict(html_filepath):
+    # Plain dicts are cheaper to ship back from the workers than ArticlePairs
+    article_pair = extract_articlepair(html_filepath)
+    return article_pair.to_dict() if article_pair else None
+
+
+def extract_file_articlepair_dict(html_filepath):
+    # The path comes back with the pair so the caller can index the file, its
+    # signature is taken first so a rewrite during parsing is not missed
+    signature = file_signature(html_filepath)
+    return html_filepath, signature, extract_articlepair_dict(html_filepath)
 
 
 class DataProcessor:
-    def __init__(self, output_dir):
+    def __init__(
+        self,
+        output_dir,
+        workers=None,
+        chunksize=64,
+        output_format=DEFAULT_RECORD_FORMAT,
+        index=None,
+    ):
         self.output_dir = output_dir
-
-    def save_articles_to_json(self, articles, filename):
-        with open(filename, "w", encoding="utf-8") as file:
-            # Convert each Article object to its dictionary representation
-            articles_dict = [article.to_dict() for article in articles]
-            # Write the list of dictionaries to the file in JSON format
-            json.dump(articles_dict, file, ensure_ascii=False, indent=4)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.output_format = output_format
+        self.index = index
 
     def process(self, filepaths, batch_size=100):
-        # Create a pool of workers
-        pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-
-        # Asynchronously apply `process_file` to each filepath
-        results = [
-            pool.apply_async(extract_articlepair, (filepath,)) for filepath in filepaths
-        ]
-
-        pool.close()  # No more tasks will be submitted to the pool
-
-        # Initialize progress bar
-        pbar = tqdm(total=len(filepaths))
-
-        # Collect results and update progress bar
-        temp_processed_articles = []
-        for result in results:
-            article_pair = result.get()  # Wait for the result
-
-            if not article_pair:
-                continue
-
-            temp_processed_articles.append(article_pair)
-            pbar.update(1)  # Update progress bar
-
-            if len(temp_processed_articles) >= batch_size:
-                self.save_articles_to_json(
-                    temp_processed_articles,
-                    os.path.join(
-                        self.output_dir,
-                        f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                    ),
-                )
-                temp_processed_articles = []
-
-        # Save the remaining articles
-        if len(temp_processed_articles) > 0:
-            self.save_articles_to_json(
-                temp_processed_articles,
-                os.path.join(
-                    self.output_dir,
-                    f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                ),
-            )
+        pbar = tqdm(total=len(filepaths), unit="file")
+
+        pending = []
+        missing_count = 0
+        # Pairs are written as they arrive, batch files rotate by size
+        with BatchedRecordWriter(
+            self.output_dir, batch_size, self.output_format
+        ) as writer, multiprocessing.Pool(processes=self.workers) as pool:
+            # Files are handed out in chunks and collected in completion order,
+            # so one slow page does not hold back the rest
+            for filepath, signature, article_pair in pool.imap_unordered(
+                extract_file_articlepair_dict, filepaths, chunksize=self.chunksize
+            ):
+                pbar.update(1)
+
+                if not article_pair:
+                    missing_count += 1
+                else:
+                    writer.write(article_pair)
+
+                if self.index is None:
+                    continue
+
+                # A file is indexed once every batch holding its pairs is
+                # finished, its pairs end at the current count of the writer
+                pending.append((filepath, signature, writer.count))
+
+                finished = 0
+                while (
+                    finished < len(pending)
+                    and pending[finished][2] <= writer.finished_count
+                ):
+                    finished += 1
+
+                if finished:
+                    self.index.mark_processed(entry[:2] for entry in pending[:finished])
+                    del pending[:finished]
+
+        if self.index is not None:
+            self.index.mark_processed(entry[:2] for entry in pending)
 
         pbar.close()
+        print(f"{missing_count} of {len(filepaths)} files had no download url.")
 
 
 def read_filepaths_from_dir(dir, extension):
@@ -132,10 +254,22 @@ def main(args):
 
     filepaths = read_filepaths_from_dir(SOURCE_DIR, "html")
 
-    processor = DataProcessor(OUTPUT_DIR)
+    index = None
+    if args.incremental:
+        index = ProcessedFileIndex(os.path.join(OUTPUT_DIR, DEFAULT_INDEX_NAME))
+        total_count = len(filepaths)
+        filepaths = index.filter_unprocessed(filepaths)
+        print(f"Skipped {total_count - len(filepaths)} files already processed.")
+
+    processor = DataProcessor(
+        OUTPUT_DIR, args.workers, args.chunksize, args.output_format, index
+    )
 
     processor.process(filepaths, SAVE_BATCH_SIZE)
 
+    if index is not None:
+        index.close()
+
 
 def get_args():
     import argparse
@@ -165,6 +299,34 @@ def get_args():
         help="Batch size for saving the extracted article download links.",
     )
 
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=RECORD_FORMATS,
+        default=DEFAULT_RECORD_FORMAT,
+        help="Record format of the batch files.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes.",
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=64,
+        help="Number of files handed to a worker at a time.",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process files that are new or changed since the last run.",
+    )
+
     return parser.parse_args()
 
 
@@ -1,12 +1,38 @@
 import multiprocessing
-import json
+import functools
 import glob
+import gzip
 import os
 import time
 
 from bs4 import BeautifulSoup
 from tqdm import tqdm
-from datetime import datetime
+
+from utility.processed_file_index import (
+    DEFAULT_INDEX_NAME,
+    ProcessedFileIndex,
+    file_signature,
+)
+from utility.record_io import BatchedRecordWriter, DEFAULT_RECORD_FORMAT
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# The C based lexbor parser is several times faster than html.parser, the
+# BeautifulSoup backend is kept as a fallback and as the reference output
+PARSER_BACKENDS = ["selectolax", "bs4"]
+DEFAULT_PARSER_BACKEND = "selectolax" if LexborHTMLParser is not None else "bs4"
+
+# Both backends match on class tokens, so extra whitespace or additional
+# classes in the attribute do not make a card disappear
+ARTICLE_CARD_SELECTOR = "div.card.article-card.dp-card-outline"
+TITLE_SELECTOR = "h5.card-title"
+ABSTRACT_SELECTOR = "div.card-text.article-text-block"
+
+# BeautifulSoup leaves the contents of these out of .text, lexbor does not
+NON_TEXT_TAGS = ["script", "style"]
 
 
 class Article:
@@ -39,14 +65,14 @@ def parse_article(soup) -> Article:
     info_url = None
     abstract = None
 
-    title_block = soup.find("h5", {"class": "card-title"})
+    title_block = soup.select_one(TITLE_SELECTOR)
     if title_block:
         title_block = title_block.find("a")
         if title_block:
             title = sanitize(title_block.text)
             info_url = title_block["href"]
 
-    description_block = soup.find("div", {"class": "card-text article-text-block"})
+    description_block = soup.select_one(ABSTRACT_SELECTOR)
 
     if description_block:
         abstract = sanitize(description_block.text)
@@ -54,67 +80,123 @@ def parse_article(soup) -> Article:
     return Article(title, info_url, abstract)
 
 
-def extract_articles(html_filepath):
-    soup = BeautifulSoup(open(html_filepath, encoding="utf-8"), "html.parser")
+def parse_article_node(node) -> Article:
+    title = None
+    info_url = None
+    abstract = None
+
+    title_block = node.css_first(TITLE_SELECTOR)
+    if title_block:
+        title_block = title_block.css_first("a")
+        if title_block:
+            title = sanitize(title_block.text())
+            info_url = title_block.attributes["href"]
+
+    description_block = node.css_first(ABSTRACT_SELECTOR)
+
+    if description_block:
+        abstract = sanitize(description_block.text())
+
+    return Article(title, info_url, abstract)
+
+
+def extract_articles_from_html(html, backend=DEFAULT_PARSER_BACKEND):
+    if backend == "selectolax":
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(NON_TEXT_TAGS)
+        return [parse_article_node(node) for node in tree.css(ARTICLE_CARD_SELECTOR)]
+
+    if backend != "bs4":
+        raise ValueError(f"Unknown parser backend: {backend}")
+
+    soup = BeautifulSoup(html, "html.parser")
 
     articles = []
-    for item in soup.find_all("div", {"class": "card article-card dp-card-outline"}):
+    for item in soup.select(ARTICLE_CARD_SELECTOR):
         articles.append(parse_article(item))
 
     return articles
 
 
+def extract_articles(html_filepath, backend=DEFAULT_PARSER_BACKEND):
+    # Pages kept by the crawler are stored gzip compressed
+    if html_filepath.endswith(".gz"):
+        with gzip.open(html_filepath, "rt", encoding="utf-8") as file:
+            return extract_articles_from_html(file.read(), backend)
+
+    with open(html_filepath, encoding="utf-8") as file:
+        return extract_articles_from_html(file.read(), backend)
+
+
+def extract_article_dicts(html_filepath, backend=DEFAULT_PARSER_BACKEND):
+    # Plain dicts are cheaper to ship back from the workers than Article objects
+    return [article.to_dict() for article in extract_articles(html_filepath, backend)]
+
+
+def extract_file_article_dicts(html_filepath, backend=DEFAULT_PARSER_BACKEND):
+    # The path comes back with the articles so the caller can index the file, its
+    # signature is taken first so a rewrite during parsing is not missed
+    signature = file_signature(html_filepath)
+    return html_filepath, signature, extract_article_dicts(html_filepath, backend)
+
+
 class DataProcessor:
-    def __init__(self, output_dir):
+    def __init__(
+        self,
+        output_dir,
+        parser_backend=DEFAULT_PARSER_BACKEND,
+        workers=None,
+        chunksize=64,
+        output_format=DEFAULT_RECORD_FORMAT,
+        index=None,
+    ):
         self.output_dir = output_dir
-
-    def save_articles_to_json(self, articles, filename):
-        with open(filename, "w", encoding="utf-8") as file:
-            # Convert each Article object to its dictionary representation
-            articles_dict = [article.to_dict() for article in articles]
-            # Write the list of dictionaries to the file in JSON format
-            json.dump(articles_dict, file, ensure_ascii=False, indent=4)
+        self.parser_backend = parser_backend
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.output_format = output_format
+        self.index = index
 
     def process(self, filepaths, batch_size=100):
-        # Create a pool of workers
-        pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-
-        # Asynchronously apply `process_file` to each filepath
-        results = [
-            pool.apply_async(extract_articles, (filepath,)) for filepath in filepaths
-        ]
-
-        pool.close()  # No more tasks will be submitted to the pool
-
-        # Initialize progress bar
-        pbar = tqdm(total=len(filepaths))
-
-        # Collect results and update progress bar
-        temp_processed_articles = []
-        for result in results:
-            articles = result.get()  # Wait for the result
-            temp_processed_articles.extend(articles)
-            pbar.update(1)  # Update progress bar
-
-            if len(temp_processed_articles) >= batch_size:
-                self.save_articles_to_json(
-                    temp_processed_articles,
-                    os.path.join(
-                        self.output_dir,
-                        f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                    ),
-                )
-                temp_processed_articles = []
-
-        # Save the remaining articles
-        if len(temp_processed_articles) > 0:
-            self.save_articles_to_json(
-                temp_processed_articles,
-                os.path.join(
-                    self.output_dir,
-                    f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
-                ),
-            )
+        worker = functools.partial(
+            extract_file_article_dicts, backend=self.parser_backend
+        )
+
+        pbar = tqdm(total=len(filepaths), unit="file")
+        pending = []
+
+        # Articles are written as they arrive, batch files rotate by size
+        with BatchedRecordWriter(
+            self.output_dir, batch_size, self.output_format
+        ) as writer, multiprocessing.Pool(processes=self.workers) as pool:
+            # Files are handed out in chunks and collected in completion order,
+            # so one slow page does not hold back the rest
+            for filepath, signature, articles in pool.imap_unordered(
+                worker, filepaths, chunksize=self.chunksize
+            ):
+                writer.write_many(articles)
+                pbar.update(1)
+
+                if self.index is None:
+                    continue
+
+                # A file is indexed once every batch holding its records is
+                # finished, its records end at the current count of the writer
+                pending.append((filepath, signature, writer.count))
+
+                finished = 0
+                while (
+                    finished < len(pending)
+                    and pending[finished][2] <= writer.finished_count
+                ):
+                    finished += 1
+
+                if finished:
+                    self.index.mark_processed(entry[:2] for entry in pending[:finished])
+                    del pending[:finished]
+
+        if self.index is not None:
+            self.index.mark_processed(entry[:2] for entry in pending)
 
         pbar.close()
 
@@ -123,6 +205,13 @@ def read_filepaths_from_dir(dir, extension):
     return glob.glob(f"{dir}/*.{extension}")
 
 
+def read_page_filepaths_from_dir(dir):
+    # Downloaded pages and the gzip compressed ones kept by the crawler
+    return read_filepaths_from_dir(dir, "html") + read_filepaths_from_dir(
+        dir, "html.gz"
+    )
+
+
 def makedirsifnotexists(dir):
     if not os.path.exists(dir):
         os.makedirs(dir)
@@ -132,15 +221,33 @@ def main():
     SOURCE_DIR = "C:\Workzone\DergiparkScraper\dergipark_htmls"
     OUTPUT_DIR = "dergipark_articles"
     SAVE_BATCH_SIZE = 50000
+    PARSER_BACKEND = DEFAULT_PARSER_BACKEND
+    WORKERS = multiprocessing.cpu_count()
+    CHUNKSIZE = 64
+    OUTPUT_FORMAT = DEFAULT_RECORD_FORMAT
+    # Only parse files that are new or changed since the last run
+    INCREMENTAL = False
 
     makedirsifnotexists(OUTPUT_DIR)
 
-    filepaths = read_filepaths_from_dir(SOURCE_DIR, "html")
+    filepaths = read_page_filepaths_from_dir(SOURCE_DIR)
 
-    processor = DataProcessor(OUTPUT_DIR)
+    index = None
+    if INCREMENTAL:
+        index = ProcessedFileIndex(os.path.join(OUTPUT_DIR, DEFAULT_INDEX_NAME))
+        total_count = len(filepaths)
+        filepaths = index.filter_unprocessed(filepaths)
+        print(f"Skipped {total_count - len(filepaths)} files already processed.")
+
+    processor = DataProcessor(
+        OUTPUT_DIR, PARSER_BACKEND, WORKERS, CHUNKSIZE, OUTPUT_FORMAT, index
+    )
 
     processor.process(filepaths, SAVE_BATCH_SIZE)
 
+    if index is not None:
+        index.close()
+
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -1,9 +1,20 @@
 import os
-import glob
-import json
+import argparse
 
+from contextlib import ExitStack
 from tqdm import tqdm
 
+from utility.record_io import (
+    RecordWriter,
+    DEFAULT_RECORD_FORMAT,
+    RECORD_FORMATS,
+    get_record_extension,
+    iter_records,
+    list_record_files,
+)
+
+OUTPUT_FORMATS = RECORD_FORMATS + ["parquet"]
+
 
 class Article:
     def __init__(self, title, info_url, abstract, language):
@@ -32,13 +43,9 @@ class Article:
         return cls(title, info_url, abstract, language)
 
 
-def read_articles_from_json(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        return [Article.from_dict(article) for article in json.load(file)]
-
-
-def get_all_json_files_in_dir(dir_path):
-    return glob.glob(os.path.join(dir_path, "*.json"))
+def read_articles_from_file(file_path):
+    for article in iter_records(file_path):
+        yield Article.from_dict(article)
 
 
 def makedirsifnotexists(dir_path):
@@ -46,40 +53,100 @@ def makedirsifnotexists(dir_path):
         os.makedirs(dir_path)
 
 
-def main():
-    SOURCE_DIR = "dergipark_articles_with_language"
-    DEST_DIR = "dergipark_articles_turkish"
-    LANGUAGE_WHITELIST = ["turkish"]
+def open_language_writer(dest_dir, language, output_format):
+    if output_format == "parquet":
+        # Imported lazily so the record formats do not require pyarrow
+        from utility.parquet_writer import ArticleParquetWriter
 
+        path = os.path.join(dest_dir, f"dergipark_articles_{language}.parquet")
+        return ArticleParquetWriter(path)
+
+    extension = get_record_extension(output_format)
+    return RecordWriter(
+        os.path.join(dest_dir, f"dergipark_articles_{language}{extension}")
+    )
+
+
+def filter_articles(source_dir, dest_dir, languages, output_format):
+    """
+    Routes every whitelisted language to its own output file in a single pass
+    and returns the number of articles seen per language.
+    """
     language_counts = {}
 
-    makedirsifnotexists(DEST_DIR)
+    with ExitStack() as stack:
+        writers = {
+            language: stack.enter_context(
+                open_language_writer(dest_dir, language, output_format)
+            )
+            for language in languages
+        }
+
+        for file_path in tqdm(list_record_files(source_dir)):
+            for article in read_articles_from_file(file_path):
+                language_counts[article.language] = (
+                    language_counts.get(article.language, 0) + 1
+                )
+
+                writer = writers.get(article.language)
+                if writer is not None:
+                    writer.write(article.to_dict())
+
+    return language_counts
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Split language tagged articles into one file per language"
+    )
+
+    parser.add_argument(
+        "--source_dir",
+        type=str,
+        default="dergipark_articles_with_language",
+        help="Directory containing the language tagged article files.",
+    )
+
+    parser.add_argument(
+        "--dest_dir",
+        type=str,
+        default="dergipark_articles_turkish",
+        help="Directory to write the per language files to.",
+    )
 
-    filtered_articles = []
+    parser.add_argument(
+        "--languages",
+        type=str,
+        nargs="+",
+        default=["turkish"],
+        help="Languages to keep, each one is written to its own file.",
+    )
 
-    for file_path in tqdm(get_all_json_files_in_dir(SOURCE_DIR)):
-        articles = read_articles_from_json(file_path)
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default=DEFAULT_RECORD_FORMAT,
+        help="Format of the output files.",
+    )
 
-        for article in articles:
-            if article.language not in language_counts:
-                language_counts[article.language] = 0
+    return parser.parse_args()
 
-            else:
-                language_counts[article.language] += 1
 
-            if article.language in LANGUAGE_WHITELIST:
-                filtered_articles.append(article)
+def main(args):
+    makedirsifnotexists(args.dest_dir)
 
-    with open(
-        os.path.join(DEST_DIR, "dergipark_articles_turkish"), "w", encoding="utf-8"
-    ) as file:
-        # Convert each Article object to its dictionary representation
-        articles_dict = [article.to_dict() for article in filtered_articles]
-        # Write the list of dictionaries to the file in JSON format
-        json.dump(articles_dict, file, ensure_ascii=False, indent=4)
+    language_counts = filter_articles(
+        args.source_dir, args.dest_dir, args.languages, args.output_format
+    )
 
-    print(language_counts)
+    for language, count in sorted(
+        language_counts.items(), key=lambda item: item[1], reverse=True
+    ):
+        kept = " (kept)" if language in args.languages else ""
+        print(f"{language}: {count}{kept}")
 
 
 if __name__ == "__main__":
-    main()
+    args = get_args()
+    main(args)
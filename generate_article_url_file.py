@@ -1,34 +1,33 @@
-import glob
-import json
-
 from extract_articles import Article
+from utility.record_io import iter_records, list_record_files
+from utility.url_frontier import QUEUE_INFO, URLFrontier
 
 
-def read_filepaths_from_dir(dir, extension):
-    return glob.glob(f"{dir}/*.{extension}")
-
-
-def read_json_file(filepath):
-    with open(filepath, "r", encoding="utf-8") as file:
-        return json.load(file)
+def iter_info_urls(filepaths):
+    for filepath in filepaths:
+        for article_json in iter_records(filepath):
+            if article_json["info_url"]:
+                yield article_json["info_url"]
 
 
 def main():
     SOURCE_DIR = "dergipark_articles"
+    # Queue the urls in this URL frontier instead of writing info_urls.txt
+    FRONTIER_PATH = None
 
-    filepaths = read_filepaths_from_dir(SOURCE_DIR, "json")
-
-    info_urls = []
-
-    for filepath in filepaths:
-        json_data = read_json_file(filepath)
+    filepaths = list_record_files(SOURCE_DIR)
 
-        for article_json in json_data:
-            info_urls.append(article_json["info_url"])
+    if FRONTIER_PATH:
+        frontier = URLFrontier(FRONTIER_PATH)
+        added = frontier.add_many(iter_info_urls(filepaths), QUEUE_INFO)
+        print(f"Queued {added} new info urls.")
+        frontier.close()
+        return
 
     with open("info_urls.txt", "w", encoding="utf-8") as file:
-        for info_url in info_urls:
-            file.write(f"{info_url}\n")
+        for filepath in filepaths:
+            for article_json in iter_records(filepath):
+                file.write(f"{article_json['info_url']}\n")
 
 
 if __name__ == "__main__":
@@ -1,4 +1,47 @@
+import os
+import re
 import math
+import gzip
+import time
+
+import requests
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from downloader import slugify
+from extract_articles import DEFAULT_PARSER_BACKEND, extract_articles_from_html
+from utility.request_tool import RequestTool
+from utility.retry_policy import RetryPolicy, parse_retry_after
+
+RESULTS_PER_PAGE = 24
+
+# The search markup is not versioned, so these only rely on the page links
+# having the /search/<page> form and on the count being followed by a word
+# like "sonuç" or "results"
+PAGE_LINK_PATTERN = re.compile(r"href=[\"'][^\"']*?/search/(\d+)[?\"'#]")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Appended to the search urls of an incremental crawl so the newest articles
+# come first and the crawl can stop at the first known one
+NEWEST_FIRST_QUERY = "sortBy=newest"
+RESULT_COUNT_PATTERN = re.compile(
+    r"(\d{1,3}(?:[.,]\d{3})+|\d+)\s+(?:sonuç|results?|kayıt|makale)",
+    re.IGNORECASE,
+)
+
+
+def parse_last_page_link(html):
+    """Highest page number linked from the pagination, None without links."""
+    pages = [int(page) for page in PAGE_LINK_PATTERN.findall(html)]
+    return max(pages, default=None)
+
+
+def parse_result_count(html):
+    match = RESULT_COUNT_PATTERN.search(TAG_PATTERN.sub(" ", html))
+    if match is None:
+        return None
+    return int(match.group(1).replace(".", "").replace(",", ""))
 
 
 class PublisherScraper:
@@ -7,28 +50,310 @@ class PublisherScraper:
         pass
 
     def calculate_page_count(self, article_count: int):
-        return math.ceil(article_count / 24)
-
-    def generate_publisher_url_with_pages(self, prefix, publisher_url, page_count):
-        def assamble_url(base_url, page):
-            parts = base_url.split("/search")
+        return math.ceil(article_count / RESULTS_PER_PAGE)
 
-            # Check if the URL is valid and can be split correctly
-            if len(parts) != 2:
-                raise ValueError("Invalid URL format")
+    def publisher_page_url(self, prefix, publisher_url, page):
+        parts = publisher_url.split("/search")
 
-            # Insert the page number
-            modified_url = parts[0] + "/search/" + str(page) + parts[1]
+        # Check if the URL is valid and can be split correctly
+        if len(parts) != 2:
+            raise ValueError("Invalid URL format")
 
-            return modified_url
+        # Insert the page number
+        return prefix + parts[0] + "/search/" + str(page) + parts[1]
 
+    def generate_publisher_url_with_pages(self, prefix, publisher_url, page_count):
         urls = []
         for i in range(1, page_count + 1):
-            urls.append(prefix + assamble_url(publisher_url, i))
+            urls.append(self.publisher_page_url(prefix, publisher_url, i))
 
         return urls
 
 
+def add_query(url, query):
+    if not query:
+        return url
+    return url + ("&" if "?" in url else "?") + query
+
+
+class PublisherPages:
+    """
+    Pagination state of one publisher while it is being crawled. A publisher
+    with a `known_count` from an earlier crawl is walked one page at a time
+    until the first known article instead of being paginated in full.
+    """
+
+    def __init__(self, publisher_url, article_count=None, known_count=None):
+        self.publisher_url = publisher_url
+        self.article_count = article_count
+        self.known_count = known_count
+        # Unknown until the first page is in
+        self.last_page = None
+        # Pages queued or in flight, the publisher is done when it drops to 0
+        self.scheduled_pages = 0
+
+        self.new_count = 0
+        self.failed = False
+
+    def is_incremental(self):
+        return self.known_count is not None
+
+    def expects_more(self):
+        """Whether fewer new articles were found than the counts differ by."""
+        if self.article_count is None:
+            return True
+        return self.new_count < self.article_count - self.known_count
+
+    def find_last_page(self, html, card_count):
+        """
+        Works out the last page from the first one: the pagination links,
+        then the result count, then the stale count from publishers.json.
+        """
+        if card_count < RESULTS_PER_PAGE:
+            return 1
+
+        last_page = parse_last_page_link(html)
+        if last_page:
+            return last_page
+
+        result_count = parse_result_count(html)
+        if result_count:
+            return math.ceil(result_count / RESULTS_PER_PAGE)
+
+        return max(1, math.ceil((self.article_count or 0) / RESULTS_PER_PAGE))
+
+
+class SearchPageCrawler:
+    """
+    Fetches search result pages through RequestTool and parses their article
+    cards straight from the response, so pages never have to be written to
+    disk and read back before extraction. Raw pages can still be kept, gzip
+    compressed, by passing `raw_html_dir`.
+    """
+
+    def __init__(
+        self,
+        writer,
+        raw_html_dir=None,
+        parser_backend=DEFAULT_PARSER_BACKEND,
+        max_workers=20,
+        max_retries=3,
+        retry_backoff=0.5,
+        max_backoff=60.0,
+        timeout=30,
+    ):
+        self.writer = writer
+        self.raw_html_dir = raw_html_dir
+        self.parser_backend = parser_backend
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retry_policy = RetryPolicy(max_retries, retry_backoff, max_backoff)
+        self.request_tool = RequestTool()
+
+        self.page_count = 0
+        self.article_count = 0
+        self.failed_urls = []
+
+        # State updates wait here, tagged with the record count of the writer
+        # they need, until the batch holding those records is finished
+        self.state = None
+        self.pending_state = deque()
+
+    def fetch_page(self, url):
+        failed_attempts = 0
+        while True:
+            try:
+                response = self.request_tool.get(url, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                response = None
+
+            status_code = response.status_code if response is not None else None
+            if status_code == 200:
+                return response.text
+
+            failed_attempts += 1
+            if not self.retry_policy.should_retry(failed_attempts, status_code):
+                print(f"Failed to fetch {url} ({status_code})")
+                return None
+
+            retry_after = None
+            if response is not None:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            time.sleep(self.retry_policy.get_delay(failed_attempts, retry_after))
+
+    def store_raw_html(self, url, html):
+        # Same name the downloader would use, with .gz appended
+        path = os.path.join(self.raw_html_dir, f"{slugify(url)}.html.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(html)
+
+    def crawl_publisher_page(self, url, publisher, page):
+        html = self.fetch_page(url)
+        if html is None:
+            return None, None
+
+        if self.raw_html_dir:
+            self.store_raw_html(url, html)
+
+        articles = extract_articles_from_html(html, self.parser_backend)
+
+        last_page = None
+        if page == 1:
+            last_page = publisher.find_last_page(html, len(articles))
+
+        return [article.to_dict() for article in articles], last_page
+
+    def _queue_state(self, publisher_url, article_ids, article_count=None):
+        self.pending_state.append(
+            (self.writer.count, publisher_url, article_ids, article_count)
+        )
+        self._commit_state(self.writer)
+
+    def _commit_state(self, writer):
+        while self.pending_state and self.pending_state[0][0] <= writer.finished_count:
+            _, publisher_url, article_ids, article_count = self.pending_state.popleft()
+            self.state.record_crawl(publisher_url, article_ids, article_count)
+
+    def _schedule(self, ready, publisher, pages):
+        for page in pages:
+            publisher.scheduled_pages += 1
+            ready.append((publisher, page))
+
+    def _unschedule(self, publisher):
+        publisher.scheduled_pages -= 1
+        if publisher.scheduled_pages != 0 or self.state is None:
+            return
+
+        # Every page is in, the count is only stored for complete crawls
+        article_count = None if publisher.failed else publisher.article_count
+        if article_count is not None and publisher.is_incremental():
+            if publisher.expects_more():
+                # Stored, the count would keep the missing articles out of
+                # every later plan, the next run looks for them again
+                print(
+                    f"Found {publisher.new_count} of"
+                    f" {publisher.article_count - publisher.known_count} new"
+                    f" articles of {publisher.publisher_url}, keeping the old count."
+                )
+                article_count = None
+
+        self._queue_state(publisher.publisher_url, [], article_count)
+
+    def _handle_publisher_page(self, ready, publisher, page, articles, last_page):
+        page_size = len(articles)
+        if self.state is not None:
+            known_ids = self.state.known_article_ids(
+                publisher.publisher_url,
+                (article["info_url"] for article in articles),
+            )
+            articles = [
+                article for article in articles if article["info_url"] not in known_ids
+            ]
+
+        self.writer.write_many(articles)
+        self.page_count += 1
+        self.article_count += len(articles)
+        publisher.new_count += len(articles)
+
+        if self.state is not None and articles:
+            self._queue_state(
+                publisher.publisher_url, [article["info_url"] for article in articles]
+            )
+
+        if publisher.is_incremental():
+            # Newest first, so a known article means the rest of the pages
+            # are known as well
+            if (
+                len(articles) == page_size
+                and page_size >= RESULTS_PER_PAGE
+                and publisher.expects_more()
+            ):
+                publisher.last_page = page + 1
+                self._schedule(ready, publisher, [page + 1])
+            return
+
+        if page == 1:
+            publisher.last_page = last_page
+            self._schedule(ready, publisher, range(2, last_page + 1))
+        elif not page_size:
+            # Past the real end, pages still queued are dropped
+            publisher.last_page = min(publisher.last_page, page - 1)
+
+        if page == publisher.last_page and page_size >= RESULTS_PER_PAGE:
+            # A full last page means the count was short
+            publisher.last_page += 1
+            self._schedule(ready, publisher, [publisher.last_page])
+
+    def crawl_publishers(self, prefix, publishers, pbar=None, state=None, query=None):
+        """
+        Crawls every page of the given publishers. The first page of each
+        publisher decides how many pages are requested after it, a page
+        without article cards cuts the rest of that publisher off and a full
+        last page adds one more, so drifted counts neither waste requests nor
+        miss pages.
+
+        With a CrawlState only articles it does not know yet are written, and
+        incremental publishers stop at the first page that contains a known
+        article. Their new count is only stored once as many new articles
+        were found as it grew by. The state follows the writer batch by batch: ids and counts
+        are recorded once the batch holding the articles is finished, the
+        last ones when the caller closes the writer.
+        """
+        self.state = state
+        if state is not None:
+            self.writer.add_batch_callback(self._commit_state)
+
+        ready = deque()
+        for publisher in publishers:
+            self._schedule(ready, publisher, [1])
+
+        max_in_flight = self.max_workers * 2
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            while True:
+                while ready and len(pending) < max_in_flight:
+                    publisher, page = ready.popleft()
+                    if publisher.last_page is not None and page > publisher.last_page:
+                        self._unschedule(publisher)
+                        continue
+
+                    url = PublisherScraper([]).publisher_page_url(
+                        prefix, add_query(publisher.publisher_url, query), page
+                    )
+                    future = executor.submit(
+                        self.crawl_publisher_page, url, publisher, page
+                    )
+                    pending[future] = (url, publisher, page)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, publisher, page = pending.pop(future)
+                    try:
+                        articles, last_page = future.result()
+                    except Exception as e:
+                        # A page that breaks the parser must not end the crawl
+                        print(f"Failed to crawl {url}: {e!r}")
+                        articles, last_page = None, None
+                    if pbar is not None:
+                        pbar.update(1)
+
+                    if articles is None:
+                        publisher.failed = True
+                        self.failed_urls.append(url)
+                    else:
+                        self._handle_publisher_page(
+                            ready, publisher, page, articles, last_page
+                        )
+
+                    self._unschedule(publisher)
+
+        return self.failed_urls
+
+
 if __name__ == "__main__":
     publisher_scraper = PublisherScraper(
         publisher_urls=[
@@ -1,11 +1,26 @@
 import os
 import json
+import time
+import argparse
 
 from tqdm import tqdm
 
 from publisher_finder import Publisher
 from utility.request_tool import RequestTool
-from landing_scraper import PublisherScraper
+from utility.crawl_state import CrawlState, DEFAULT_STATE_NAME
+from utility.url_frontier import QUEUE_SEARCH, URLFrontier
+from utility.record_io import (
+    BatchedRecordWriter,
+    DEFAULT_RECORD_FORMAT,
+    RECORD_FORMATS,
+)
+from landing_scraper import (
+    NEWEST_FIRST_QUERY,
+    PublisherPages,
+    PublisherScraper,
+    SearchPageCrawler,
+)
+from extract_articles import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS
 
 
 def read_json_file(filename):
@@ -20,31 +35,278 @@ def write_to_txt_file_line_by_line(filename, lines):
             file.write(line + "\n")
 
 
-def main():
-    publishers = read_json_file("publishers.json")
+SEARCH_URL_PREFIX = "https://dergipark.org.tr"
 
-    publisher_objects = []
-    for publisher in publishers:
-        publisher_objects.append(Publisher.from_dict(publisher))
 
+def generate_search_urls(publishers):
     publisher_scarper = PublisherScraper([])
 
     urls = []
 
-    for publisher in tqdm(publisher_objects):
+    for publisher in tqdm(publishers):
         urls.extend(
             publisher_scarper.generate_publisher_url_with_pages(
-                "https://dergipark.org.tr",
+                SEARCH_URL_PREFIX,
                 publisher.url,
                 publisher_scarper.calculate_page_count(publisher.article_count),
             )
         )
 
-    write_to_txt_file_line_by_line("urls.txt", urls)
+    return urls
+
+
+def plan_publishers(publishers, state):
+    """
+    Pairs every publisher with its stored article count. Publishers whose
+    fresh count from publisher_finder.py matches the stored one are skipped.
+    """
+    planned = []
+    for publisher in publishers:
+        known_count = state.get_article_count(publisher.url)
+        if known_count is not None and known_count == publisher.article_count:
+            continue
+        planned.append(
+            PublisherPages(publisher.url, publisher.article_count, known_count)
+        )
+
+    print(f"{len(publishers) - len(planned)} publishers have no new articles.")
+    return planned
+
+
+def crawl(publishers, args):
+    request_tool = RequestTool()
+    request_tool.configure_pool(args.workers, args.workers)
+    request_tool.configure_rate_limit(host_rate=args.host_rate, burst=args.burst)
+    request_tool.read_from_proxy_file(args.proxy)
+    if args.cache_dir:
+        request_tool.configure_cache(
+            args.cache_dir,
+            max_bytes=args.cache_size_mb * 1024 * 1024 if args.cache_size_mb else None,
+            ttl=args.cache_ttl_hours * 3600 if args.cache_ttl_hours else None,
+        )
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    if args.raw_html_dir and not os.path.exists(args.raw_html_dir):
+        os.makedirs(args.raw_html_dir)
+
+    state = None
+    query = None
+    if args.incremental:
+        state = CrawlState(os.path.join(args.output_dir, DEFAULT_STATE_NAME))
+        query = args.newest_first_query
+        planned = plan_publishers(publishers, state)
+    else:
+        planned = [
+            PublisherPages(publisher.url, publisher.article_count)
+            for publisher in publishers
+        ]
+
+    with BatchedRecordWriter(
+        args.output_dir, args.batch_size, args.output_format
+    ) as writer, tqdm(unit="page") as pbar:
+        crawler = SearchPageCrawler(
+            writer,
+            raw_html_dir=args.raw_html_dir,
+            parser_backend=args.parser,
+            max_workers=args.workers,
+            max_retries=args.max_retries,
+        )
+        # Page counts come from the first page of each publisher, not from
+        # the article counts in publishers.json
+        failed_urls = crawler.crawl_publishers(
+            SEARCH_URL_PREFIX, planned, pbar, state, query
+        )
+
+    if state is not None:
+        state.close()
+
+    print(f"Extracted {crawler.article_count} articles from {crawler.page_count} pages.")
+
+    if failed_urls:
+        write_to_txt_file_line_by_line(args.failed_urls, failed_urls)
+        print(f"{len(failed_urls)} pages failed, written to {args.failed_urls}")
+
+
+def main(args):
+    publishers = read_json_file(args.publishers)
+
+    publisher_objects = []
+    for publisher in publishers:
+        publisher_objects.append(Publisher.from_dict(publisher))
+
+    if args.crawl:
+        crawl(publisher_objects, args)
+        return
+
+    urls = generate_search_urls(publisher_objects)
+
+    if args.frontier:
+        frontier = URLFrontier(args.frontier)
+        added = frontier.add_many(urls, QUEUE_SEARCH)
+        print(f"Queued {added} new search page urls.")
+        frontier.close()
+        return
+
+    write_to_txt_file_line_by_line(args.urls, urls)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Generate the search result page urls of every publisher, "
+        "or crawl them and extract their articles directly."
+    )
+
+    parser.add_argument(
+        "--publishers",
+        type=str,
+        default="publishers.json",
+        help="Publisher list written by publisher_finder.py.",
+    )
+
+    parser.add_argument(
+        "--urls",
+        type=str,
+        default="urls.txt",
+        help="File to write the search page urls to when not crawling.",
+    )
+
+    parser.add_argument(
+        "--frontier",
+        type=str,
+        default=None,
+        help="Queue the search page urls in this URL frontier instead.",
+    )
+
+    parser.add_argument(
+        "--crawl",
+        action="store_true",
+        help="Fetch the search pages and extract their articles in memory.",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only collect articles added since the last crawl, newest first.",
+    )
+
+    parser.add_argument(
+        "--newest_first_query",
+        type=str,
+        default=NEWEST_FIRST_QUERY,
+        help="Query appended to the search urls to sort them newest first.",
+    )
+
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="dergipark_articles",
+        help="Directory to write the extracted articles to.",
+    )
+
+    parser.add_argument(
+        "--raw_html_dir",
+        type=str,
+        default=None,
+        help="Also keep the fetched pages here, gzip compressed.",
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=50000,
+        help="Number of articles per batch file.",
+    )
+
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=RECORD_FORMATS,
+        default=DEFAULT_RECORD_FORMAT,
+        help="Record format of the batch files.",
+    )
+
+    parser.add_argument(
+        "--parser",
+        type=str,
+        choices=PARSER_BACKENDS,
+        default=DEFAULT_PARSER_BACKEND,
+        help="HTML parser backend.",
+    )
+
+    parser.add_argument(
+        "--proxy",
+        type=str,
+        default="proxy_file.json",
+        help="Proxy file path.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=20,
+        help="Number of pages fetched at the same time.",
+    )
+
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=3,
+        help="Maximum number of retries per page.",
+    )
+
+    parser.add_argument(
+        "--host_rate",
+        type=float,
+        default=None,
+        help="Maximum requests per second to the host.",
+    )
+
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=None,
+        help="Burst size of the rate limit.",
+    )
+
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Cache pages here and revalidate them with conditional requests.",
+    )
+
+    parser.add_argument(
+        "--cache_size_mb",
+        type=int,
+        default=None,
+        help="Size limit of the page cache, least recently used pages go first.",
+    )
+
+    parser.add_argument(
+        "--cache_ttl_hours",
+        type=float,
+        default=None,
+        help="Drop cached pages that were not revalidated for this long.",
+    )
+
+    parser.add_argument(
+        "--failed_urls",
+        type=str,
+        default="failed_urls.txt",
+        help="File to write the pages that could not be fetched to.",
+    )
+
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    start_time = time.time()
+
+    args = get_args()
+    main(args)
+    print("Done.")
+    print("--- %s seconds ---" % (time.time() - start_time))
 
 
 """
@@ -0,0 +1,219 @@
+import time
+import argparse
+import functools
+import multiprocessing
+
+from contextlib import ExitStack
+from tqdm import tqdm
+
+from extract_articles import (
+    DEFAULT_PARSER_BACKEND,
+    PARSER_BACKENDS,
+    extract_article_dicts,
+    read_page_filepaths_from_dir,
+    makedirsifnotexists,
+)
+from detect_languages_on_articles import init_detector, detect_languages_of_titles
+from filter_articles_by_language import OUTPUT_FORMATS, open_language_writer
+from utility.record_io import BatchedRecordWriter, DEFAULT_RECORD_FORMAT
+
+
+def process_html_file(html_filepath, backend=DEFAULT_PARSER_BACKEND):
+    """Parses one search results page and tags its articles with a language."""
+    articles = extract_article_dicts(html_filepath, backend)
+
+    languages = detect_languages_of_titles([article["title"] for article in articles])
+    for article, language in zip(articles, languages):
+        article["language"] = language
+
+    return articles
+
+
+def run_pipeline(
+    filepaths,
+    dest_dir,
+    languages,
+    output_format=DEFAULT_RECORD_FORMAT,
+    info_urls_file="info_urls.txt",
+    checkpoint_dir=None,
+    checkpoint_batch_size=50000,
+    parser_backend=DEFAULT_PARSER_BACKEND,
+    workers=None,
+    chunksize=64,
+):
+    """
+    Runs extraction, language detection, filtering and info url generation
+    in one pass over the HTML files. Articles flow from the workers straight
+    into the per language writers and are only written to disk once, plus
+    optionally as a checkpoint of every tagged article.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    threads_per_worker = max(1, multiprocessing.cpu_count() // workers)
+    worker = functools.partial(process_html_file, backend=parser_backend)
+
+    language_counts = {}
+
+    with ExitStack() as stack:
+        writers = {
+            language: stack.enter_context(
+                open_language_writer(dest_dir, language, output_format)
+            )
+            for language in languages
+        }
+
+        info_urls = stack.enter_context(
+            open(info_urls_file, "w", encoding="utf-8")
+        )
+
+        checkpoint = None
+        if checkpoint_dir:
+            makedirsifnotexists(checkpoint_dir)
+            checkpoint = stack.enter_context(
+                BatchedRecordWriter(checkpoint_dir, checkpoint_batch_size)
+            )
+
+        pool = stack.enter_context(
+            multiprocessing.Pool(
+                processes=workers,
+                initializer=init_detector,
+                initargs=(threads_per_worker,),
+            )
+        )
+
+        pbar = stack.enter_context(tqdm(total=len(filepaths), unit="file"))
+
+        for articles in pool.imap_unordered(worker, filepaths, chunksize=chunksize):
+            pbar.update(1)
+
+            for article in articles:
+                language = article["language"]
+                language_counts[language] = language_counts.get(language, 0) + 1
+
+                if checkpoint is not None:
+                    checkpoint.write(article)
+
+                writer = writers.get(language)
+                if writer is None:
+                    continue
+
+                writer.write(article)
+                if article["info_url"]:
+                    info_urls.write(f"{article['info_url']}\n")
+
+    return language_counts
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Turn search result HTML files into per language article files "
+        "and an info url list in a single pass."
+    )
+
+    parser.add_argument(
+        "--source_dir",
+        type=str,
+        required=True,
+        help="Directory containing HTML files, gzip compressed or not.",
+    )
+
+    parser.add_argument(
+        "--dest_dir",
+        type=str,
+        default="dergipark_articles_turkish",
+        help="Directory to write the per language files to.",
+    )
+
+    parser.add_argument(
+        "--languages",
+        type=str,
+        nargs="+",
+        default=["turkish"],
+        help="Languages to keep, each one is written to its own file.",
+    )
+
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default=DEFAULT_RECORD_FORMAT,
+        help="Format of the per language files.",
+    )
+
+    parser.add_argument(
+        "--info_urls",
+        type=str,
+        default="info_urls.txt",
+        help="File to write the info urls of the kept articles to.",
+    )
+
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="Also write every language tagged article to this directory.",
+    )
+
+    parser.add_argument(
+        "--checkpoint_batch_size",
+        type=int,
+        default=50000,
+        help="Batch size of the checkpoint files.",
+    )
+
+    parser.add_argument(
+        "--parser",
+        type=str,
+        choices=PARSER_BACKENDS,
+        default=DEFAULT_PARSER_BACKEND,
+        help="HTML parser backend.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes.",
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=64,
+        help="Number of files handed to a worker at a time.",
+    )
+
+    return parser.parse_args()
+
+
+def main(args):
+    makedirsifnotexists(args.dest_dir)
+
+    filepaths = read_page_filepaths_from_dir(args.source_dir)
+
+    language_counts = run_pipeline(
+        filepaths,
+        args.dest_dir,
+        args.languages,
+        output_format=args.output_format,
+        info_urls_file=args.info_urls,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_batch_size=args.checkpoint_batch_size,
+        parser_backend=args.parser,
+        workers=args.workers,
+        chunksize=args.chunksize,
+    )
+
+    for language, count in sorted(
+        language_counts.items(), key=lambda item: item[1], reverse=True
+    ):
+        kept = " (kept)" if language in args.languages else ""
+        print(f"{language}: {count}{kept}")
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+
+    args = get_args()
+    main(args)
+    print("Done.")
+    print("--- %s seconds ---" % (time.time() - start_time))
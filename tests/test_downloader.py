@@ -0,0 +1,69 @@
+import threading
+
+import downloader as downloader_module
+from downloader import URLDownloader
+
+
+class BackoffDownloader(URLDownloader):
+    """Every URL is asked to back off once before it succeeds."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = set()
+        self.max_started = 0
+        self.lock = threading.Lock()
+
+    def download_url(self, url, failed_attempts=0, last_proxy=None):
+        with self.lock:
+            self.started.add(url)
+            self.max_started = max(self.max_started, len(self.started))
+
+        if failed_attempts == 0:
+            return 0.05, 1, None
+
+        with self.lock:
+            self.started.discard(url)
+        return None
+
+
+def test_urls_waiting_on_a_retry_count_against_the_window(tmp_path):
+    urls = (f"https://example.com/{i}" for i in range(200))
+    downloader = BackoffDownloader(
+        urls, str(tmp_path), max_workers=4, randomized_delay=False, max_in_flight=8
+    )
+
+    downloader.start_download()
+
+    assert not downloader.started
+    assert downloader.max_started <= 8
+
+
+def test_progress_counter_is_exact_under_contention(tmp_path, monkeypatch):
+    # Collected whole, print from many threads can merge lines in the output
+    messages = []
+    monkeypatch.setattr(downloader_module, "print", messages.append, raising=False)
+
+    threads = 16
+    updates_per_thread = 2000
+    downloader = URLDownloader([], str(tmp_path), randomized_delay=False)
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(updates_per_thread):
+            downloader._update_progress()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert downloader.downloaded_count == threads * updates_per_thread
+    # Every update reports the value it incremented, so none is repeated
+    reported = [
+        int(line.split()[1])
+        for line in messages
+        if line.startswith("Progress:")
+    ]
+    assert sorted(reported) == list(range(1, threads * updates_per_thread + 1))
@@ -0,0 +1,67 @@
+import pytest
+
+from extract_article_download_links import extract_articlepair, read_head
+
+
+def write_page(tmp_path, html):
+    path = tmp_path / "page.html"
+    path.write_text(html, encoding="utf-8")
+    return str(path)
+
+
+def test_body_inside_a_script_does_not_end_the_head(tmp_path):
+    path = write_page(
+        tmp_path,
+        "<html><head>"
+        "<script>document.write('<body>');</script>"
+        '<meta name="citation_pdf_url" content="u">'
+        "</head><body></body></html>",
+    )
+
+    assert extract_articlepair(path).url == "u"
+
+
+def test_body_inside_an_attribute_does_not_end_the_head(tmp_path):
+    path = write_page(
+        tmp_path,
+        '<html><head><meta name="description" content="a <body> b">'
+        '<meta name="citation_pdf_url" content="u">'
+        "</head><body></body></html>",
+    )
+
+    assert extract_articlepair(path).url == "u"
+
+
+def test_commented_out_meta_tags_are_ignored(tmp_path):
+    path = write_page(
+        tmp_path,
+        "<html><head>"
+        '<!-- <meta name="citation_pdf_url" content="bad"> -->'
+        '<meta name="citation_pdf_url" content="good">'
+        "</head><body></body></html>",
+    )
+
+    assert extract_articlepair(path).url == "good"
+
+
+def test_falls_back_to_the_whole_page_when_the_head_has_no_url(tmp_path):
+    path = write_page(
+        tmp_path,
+        "<html><head><title>t</title></head><body>"
+        '<meta name="citation_pdf_url" content="late">'
+        "</body></html>",
+    )
+
+    assert extract_articlepair(path).url == "late"
+
+
+@pytest.mark.parametrize(
+    "html, head",
+    [
+        ("<html><head><title>t</title></head><body>b", "<html><head><title>t</title>"),
+        ("<html><head><title>t</title><body>b", "<html><head><title>t</title>"),
+        ("<html><head><!-- </head> --><title>t", "<html><head> <title>t"),
+    ],
+)
+def test_head_end_detection(tmp_path, html, head):
+    assert read_head(write_page(tmp_path, html)) == head
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from extract_articles import extract_articles, extract_articles_from_html
+
+pytest.importorskip("selectolax.lexbor")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+PAGES = [
+    ("search_results_page.html", 3),
+    ("search_results_page_irregular_markup.html", 5),
+]
+
+
+def article_dicts(html, backend):
+    return [article.to_dict() for article in extract_articles_from_html(html, backend)]
+
+
+@pytest.mark.parametrize("name, card_count", PAGES)
+def test_backends_give_the_same_articles(name, card_count):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+        html = file.read()
+
+    reference = article_dicts(html, "bs4")
+
+    assert len(reference) == card_count
+    assert article_dicts(html, "selectolax") == reference
+
+
+def test_script_and_style_are_left_out_of_the_text():
+    path = os.path.join(FIXTURES_DIR, "search_results_page_irregular_markup.html")
+
+    for backend in ["bs4", "selectolax"]:
+        abstracts = [article.abstract for article in extract_articles(path, backend)]
+        assert abstracts[0] == "Özet metni"
+        assert abstracts[1] == "Stil içeren özet"
+
+
+def test_commented_out_cards_are_ignored():
+    path = os.path.join(FIXTURES_DIR, "search_results_page.html")
+
+    for backend in ["bs4", "selectolax"]:
+        urls = [article.info_url for article in extract_articles(path, backend)]
+        assert "commented" not in urls
@@ -0,0 +1,35 @@
+import os
+
+from utility.processed_file_index import ProcessedFileIndex, file_signature
+
+
+def write(path, text, mtime_ns):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_marked_files_are_skipped(tmp_path):
+    page = tmp_path / "page.html"
+    write(page, "<html></html>", 1_000_000_000)
+
+    index = ProcessedFileIndex(str(tmp_path / "index.sqlite3"))
+    index.mark_processed([(str(page), file_signature(page))])
+
+    assert index.filter_unprocessed([str(page)]) == []
+    index.close()
+
+
+def test_file_rewritten_while_parsing_is_processed_again(tmp_path):
+    page = tmp_path / "page.html"
+    write(page, "<html></html>", 1_000_000_000)
+
+    index = ProcessedFileIndex(str(tmp_path / "index.sqlite3"))
+
+    # Taken before parsing, the crawler rewrites the file before it is marked
+    signature = file_signature(page)
+    write(page, "<html><body>updated</body></html>", 2_000_000_000)
+    index.mark_processed([(str(page), signature)])
+
+    assert index.filter_unprocessed([str(page)]) == [str(page)]
+    index.close()
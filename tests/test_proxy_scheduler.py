@@ -0,0 +1,78 @@
+import threading
+
+from utility.proxy_scheduler import ProxyScheduler
+from utility.request_tool import Proxy
+
+THREADS = 8
+PICKS_PER_THREAD = 3500
+
+# Scores are inversely proportional to latency, so the proxies should be
+# picked 4 : 2 : 1
+LATENCIES = {"fast": 0.1, "medium": 0.2, "slow": 0.4}
+
+
+def make_scheduler():
+    proxies = [Proxy(host, 8080, "user", "pass") for host in LATENCIES]
+    scheduler = ProxyScheduler(proxies)
+    for proxy in proxies:
+        scheduler.record(proxy, 200, LATENCIES[proxy.host])
+    return scheduler, proxies
+
+
+def test_concurrent_picks_are_weighted_and_released():
+    scheduler, proxies = make_scheduler()
+    counts = {proxy.host: 0 for proxy in proxies}
+    counts_lock = threading.Lock()
+    max_in_flight = []
+    start = threading.Barrier(THREADS)
+
+    def worker():
+        local_counts = dict.fromkeys(counts, 0)
+        local_max = 0
+        start.wait()
+        for _ in range(PICKS_PER_THREAD):
+            proxy = scheduler.choose()
+            local_counts[proxy.host] += 1
+            local_max = max(
+                local_max, sum(stats["in_flight"] for stats in scheduler.get_stats())
+            )
+            scheduler.record(proxy, 200, LATENCIES[proxy.host])
+
+        with counts_lock:
+            for host, count in local_counts.items():
+                counts[host] += count
+            max_in_flight.append(local_max)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = THREADS * PICKS_PER_THREAD
+    weights = {host: 1 / latency for host, latency in LATENCIES.items()}
+    total_weight = sum(weights.values())
+
+    assert sum(counts.values()) == total
+    for host, count in counts.items():
+        # Smooth weighted round-robin stays within one pick per proxy of the
+        # exact share, however the threads interleave
+        assert abs(count - total * weights[host] / total_weight) <= len(proxies)
+
+    assert 0 < max(max_in_flight) <= THREADS
+
+    stats = scheduler.get_stats()
+    assert all(entry["in_flight"] == 0 for entry in stats)
+    assert sum(entry["requests"] for entry in stats) == total + len(proxies)
+
+
+def test_failed_requests_release_the_proxy():
+    scheduler, proxies = make_scheduler()
+
+    chosen = [scheduler.choose() for _ in range(6)]
+    assert sum(stats["in_flight"] for stats in scheduler.get_stats()) == 6
+
+    for proxy in chosen:
+        scheduler.record(proxy, None, 1.0)
+
+    assert all(stats["in_flight"] == 0 for stats in scheduler.get_stats())
@@ -0,0 +1,41 @@
+# -- coding: utf-8 --
+
+import os
+
+
+class ContentStore:
+    """
+    Stores files by the SHA-256 of their content under a sharded layout such
+    as objects/ab/cd/abcd...ef.pdf. Identical files reached through different
+    URLs end up stored once, and no single directory grows to millions of
+    entries.
+    """
+
+    def __init__(self, root, depth=2, width=2):
+        self.root = root
+        self.depth = depth
+        self.width = width
+
+    def path_for(self, digest, extension=""):
+        shards = [
+            digest[i * self.width : (i + 1) * self.width] for i in range(self.depth)
+        ]
+        return os.path.join(self.root, *shards, f"{digest}{extension}")
+
+    def contains(self, digest, extension=""):
+        return os.path.exists(self.path_for(digest, extension))
+
+    def put(self, temp_path, digest, extension=""):
+        """
+        Moves `temp_path` into the store and returns (path, is_new). When the
+        content is already stored the temporary file is simply discarded.
+        """
+        path = self.path_for(digest, extension)
+
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return path, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path, True
@@ -0,0 +1,96 @@
+# -- coding: utf-8 --
+
+import time
+import sqlite3
+import threading
+
+DEFAULT_STATE_NAME = ".crawl_state.sqlite3"
+
+
+class CrawlState:
+    """
+    What earlier crawls have seen of every publisher: the article count it
+    had at the time and the ids (info urls) of the articles collected from
+    it, stored in SQLite so an incremental crawl can tell new articles from
+    known ones with an indexed lookup instead of loading them all.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS publishers (
+                url TEXT PRIMARY KEY,
+                article_count INTEGER,
+                crawled_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS articles (
+                publisher_url TEXT NOT NULL,
+                article_id TEXT NOT NULL,
+                PRIMARY KEY (publisher_url, article_id)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get_article_count(self, publisher_url):
+        """Article count at the last complete crawl, None if never crawled."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT article_count FROM publishers WHERE url = ?",
+                (publisher_url,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def known_article_ids(self, publisher_url, article_ids):
+        article_ids = list(article_ids)
+        if not article_ids:
+            return set()
+
+        placeholders = ", ".join("?" * len(article_ids))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT article_id FROM articles WHERE publisher_url = ?"
+                f" AND article_id IN ({placeholders})",
+                [publisher_url, *article_ids],
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def record_crawl(self, publisher_url, article_ids, article_count=None):
+        """
+        Adds the collected article ids, and the article count if the crawl
+        of the publisher completed.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO articles (publisher_url, article_id)"
+                " VALUES (?, ?)",
+                [(publisher_url, article_id) for article_id in article_ids],
+            )
+            if article_count is not None:
+                self.connection.execute(
+                    """
+                    INSERT INTO publishers (url, article_count, crawled_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        article_count = excluded.article_count,
+                        crawled_at = excluded.crawled_at
+                    """,
+                    (publisher_url, article_count, time.time()),
+                )
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
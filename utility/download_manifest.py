@@ -0,0 +1,159 @@
+# -- coding: utf-8 --
+
+import time
+import sqlite3
+import threading
+
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+# Kept in the download directory unless a path is given
+DEFAULT_MANIFEST_NAME = ".download_manifest.sqlite3"
+
+
+class DownloadManifest:
+    """
+    Persistent record of every URL the downloader has attempted, keyed by URL
+    and stored in SQLite so a restarted run can skip completed URLs with a
+    primary key lookup and only retry the failures. The SHA-256 of each
+    completed download doubles as the URL to content index of the content
+    addressed store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS downloads (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                bytes INTEGER,
+                content_type TEXT,
+                file_name TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                sha256 TEXT
+            )
+            """
+        )
+
+        # Manifests written before content hashes were recorded
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(downloads)")
+        ]
+        if "sha256" not in columns:
+            self.connection.execute("ALTER TABLE downloads ADD COLUMN sha256 TEXT")
+
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS downloads_sha256 ON downloads (sha256)"
+        )
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, status, bytes, content_type, file_name, attempts, sha256"
+                " FROM downloads WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        keys = [
+            "url",
+            "status",
+            "bytes",
+            "content_type",
+            "file_name",
+            "attempts",
+            "sha256",
+        ]
+        return dict(zip(keys, row))
+
+    def file_name(self, url):
+        """Path of a completed download relative to the download directory."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file_name FROM downloads WHERE url = ? AND status = ?",
+                (url, STATUS_COMPLETED),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_completed(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM downloads WHERE url = ? AND status = ?",
+                (url, STATUS_COMPLETED),
+            ).fetchone()
+        return row is not None
+
+    def record_success(self, url, size, content_type, file_name, sha256=None):
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT INTO downloads (
+                    url, status, bytes, content_type, file_name, attempts,
+                    updated_at, sha256
+                )
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    status = excluded.status,
+                    bytes = excluded.bytes,
+                    content_type = excluded.content_type,
+                    file_name = excluded.file_name,
+                    attempts = attempts + 1,
+                    updated_at = excluded.updated_at,
+                    sha256 = excluded.sha256
+                """,
+                (
+                    url,
+                    STATUS_COMPLETED,
+                    size,
+                    content_type,
+                    file_name,
+                    time.time(),
+                    sha256,
+                ),
+            )
+
+    def record_failure(self, url):
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT INTO downloads (url, status, attempts, updated_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = attempts + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (url, STATUS_FAILED, time.time()),
+            )
+
+    def urls_for_hash(self, sha256):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT url FROM downloads WHERE sha256 = ?", (sha256,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, status=None):
+        with self.lock:
+            if status is None:
+                row = self.connection.execute("SELECT COUNT(*) FROM downloads")
+            else:
+                row = self.connection.execute(
+                    "SELECT COUNT(*) FROM downloads WHERE status = ?", (status,)
+                )
+            return row.fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
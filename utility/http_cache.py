@@ -0,0 +1,298 @@
+# -- coding: utf-8 --
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+import requests
+
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class TTLEviction:
+    """Drops entries that were last stored or revalidated over `ttl` seconds ago."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def is_expired(self, entry, now):
+        return now - entry["stored_at"] > self.ttl
+
+    def victims(self, cache, now):
+        return cache.urls_stored_before(now - self.ttl)
+
+
+class LRUEviction:
+    """Keeps the cache under `max_bytes`, dropping the least recently used first."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def is_expired(self, entry, now):
+        return False
+
+    def victims(self, cache, now):
+        excess = cache.total_bytes - self.max_bytes
+        if excess <= 0:
+            return []
+
+        urls = []
+        for url, size in cache.iter_least_recently_used():
+            urls.append(url)
+            excess -= size
+            if excess <= 0:
+                break
+        return urls
+
+
+class HTTPCache:
+    """
+    On-disk cache of GET responses that carry an ETag or Last-Modified
+    validator. Bodies are stored as files under `directory`, the validators
+    and headers in an SQLite index next to them. Cached entries are not
+    served blindly: the caller revalidates them with a conditional request
+    and only a 304 is answered from the cache, so an unchanged page costs a
+    few hundred bytes instead of the full body.
+
+    Eviction is delegated to policy objects with `is_expired(entry, now)`
+    and `victims(cache, now)`, TTLEviction and LRUEviction are provided.
+    """
+
+    def __init__(self, directory, policies=()):
+        self.directory = directory
+        self.policies = list(policies)
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at"
+            " ON responses (accessed_at)"
+        )
+
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, url):
+        """Returns the cached entry of a url with its body, None on a miss."""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT key, etag, last_modified, headers, stored_at"
+                " FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            entry = dict(
+                zip(["key", "etag", "last_modified", "headers", "stored_at"], row)
+            )
+            entry["url"] = url
+
+            if any(policy.is_expired(entry, now) for policy in self.policies):
+                self._delete(url)
+                return None
+
+            try:
+                with open(self._body_path(entry["key"]), "rb") as file:
+                    entry["body"] = file.read()
+            except FileNotFoundError:
+                self._delete(url)
+                return None
+
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url)
+            )
+
+        entry["headers"] = json.loads(entry["headers"])
+        return entry
+
+    def validators(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, response):
+        """Caches a 200 response if it can be revalidated later."""
+        if response.status_code != 200:
+            return
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        if "no-store" in response.headers.get("Cache-Control", "").lower():
+            return
+
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        content = response.content
+        # The body is kept decoded, so the transfer headers no longer apply
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in TRANSFER_HEADERS
+        }
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is not None:
+                self.total_bytes -= row[0]
+
+            self.connection.execute(
+                """
+                INSERT INTO responses (
+                    url, key, etag, last_modified, headers, size, stored_at,
+                    accessed_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    key = excluded.key,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    headers = excluded.headers,
+                    size = excluded.size,
+                    stored_at = excluded.stored_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (
+                    url,
+                    key,
+                    etag,
+                    last_modified,
+                    json.dumps(headers),
+                    len(content),
+                    now,
+                    now,
+                ),
+            )
+            self.total_bytes += len(content)
+
+            self._evict(now)
+
+    def revalidated(self, entry, response):
+        """
+        Builds the response for a 304 from the cached entry, taking over the
+        validators the server sent along with it.
+        """
+        headers = CaseInsensitiveDict(entry["headers"])
+        for name in ("ETag", "Last-Modified", "Cache-Control", "Expires", "Date"):
+            if name in response.headers:
+                headers[name] = response.headers[name]
+
+        with self.lock:
+            self.connection.execute(
+                """
+                UPDATE responses
+                SET etag = ?, last_modified = ?, headers = ?, stored_at = ?
+                WHERE url = ?
+                """,
+                (
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    json.dumps(dict(headers)),
+                    time.time(),
+                    entry["url"],
+                ),
+            )
+
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.url = entry["url"]
+        cached.headers = headers
+        cached.encoding = get_encoding_from_headers(cached.headers)
+        cached._content = entry["body"]
+        cached.request = response.request
+        cached.from_cache = True
+        return cached
+
+    def urls_stored_before(self, timestamp):
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT url FROM responses WHERE stored_at < ?", (timestamp,)
+            )
+        ]
+
+    def iter_least_recently_used(self):
+        # Lazy, LRUEviction stops reading as soon as enough is freed
+        return self.connection.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        )
+
+    def _delete(self, url):
+        row = self.connection.execute(
+            "SELECT key, size FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return
+
+        key, size = row
+        self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+        self.total_bytes -= size
+        try:
+            os.remove(self._body_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now):
+        # Called with the lock held
+        for policy in self.policies:
+            for url in policy.victims(self, now):
+                self._delete(url)
+
+    def evict(self):
+        with self.lock:
+            self._evict(time.time())
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,76 @@
+# -- coding: utf-8 --
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARTICLE_SCHEMA = pa.schema(
+    [
+        ("title", pa.string()),
+        ("info_url", pa.string()),
+        ("abstract", pa.string()),
+        # Only a handful of distinct values, stored as indices into a dictionary
+        ("language", pa.dictionary(pa.int32(), pa.string())),
+        ("pdf_url", pa.string()),
+    ]
+)
+
+
+class ArticleParquetWriter:
+    """
+    Buffers article dicts column by column and writes them to a Parquet file
+    one row group at a time, so readers can memory-map the file and load only
+    the columns they need.
+    """
+
+    def __init__(self, path, row_group_size=100000, compression="zstd"):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.count = 0
+
+        self.writer = pq.ParquetWriter(
+            path,
+            ARTICLE_SCHEMA,
+            compression=compression,
+            use_dictionary=["language"],
+        )
+        self.columns = {name: [] for name in ARTICLE_SCHEMA.names}
+
+    def write(self, article):
+        for name, values in self.columns.items():
+            values.append(article.get(name))
+
+        self.count += 1
+        if len(self.columns["title"]) >= self.row_group_size:
+            self.flush()
+
+    def write_many(self, articles):
+        for article in articles:
+            self.write(article)
+
+    def flush(self):
+        if not self.columns["title"]:
+            return
+
+        arrays = []
+        for field in ARTICLE_SCHEMA:
+            values = self.columns[field.name]
+            if pa.types.is_dictionary(field.type):
+                array = pa.array(values, type=pa.string()).dictionary_encode()
+            else:
+                array = pa.array(values, type=field.type)
+            arrays.append(array)
+
+        table = pa.Table.from_arrays(arrays, schema=ARTICLE_SCHEMA)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+
+        self.columns = {name: [] for name in ARTICLE_SCHEMA.names}
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
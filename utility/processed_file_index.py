@@ -0,0 +1,99 @@
+# -- coding: utf-8 --
+
+import os
+import time
+import sqlite3
+import threading
+
+# Kept in the output directory, record globs do not match it
+DEFAULT_INDEX_NAME = ".processed_files.sqlite3"
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ProcessedFileIndex:
+    """
+    Persistent record of the input files an extraction run has already
+    turned into records, keyed by absolute path and stored in SQLite next to
+    the output. A file counts as processed as long as its modification time
+    and size are unchanged, so later runs only parse new or rewritten files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                processed_at REAL NOT NULL
+            )
+            """
+        )
+
+    def filter_unprocessed(self, filepaths):
+        """Returns the files that are new or changed since they were processed."""
+        with self.lock:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self.connection.execute(
+                    "SELECT path, mtime_ns, size FROM processed_files"
+                )
+            }
+
+        unprocessed = []
+        for filepath in filepaths:
+            signature = known.get(os.path.abspath(filepath))
+            if signature is None or signature != file_signature(filepath):
+                unprocessed.append(filepath)
+        return unprocessed
+
+    def mark_processed(self, files):
+        """
+        Records (filepath, signature) pairs. The signature has to be taken
+        before the file is read, a file rewritten while it was being parsed
+        then no longer matches and is parsed again by the next run.
+        """
+        rows = []
+        now = time.time()
+        for filepath, (mtime_ns, size) in files:
+            rows.append((os.path.abspath(filepath), mtime_ns, size, now))
+
+        if not rows:
+            return
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                """
+                INSERT INTO processed_files (path, mtime_ns, size, processed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    mtime_ns = excluded.mtime_ns,
+                    size = excluded.size,
+                    processed_at = excluded.processed_at
+                """,
+                rows,
+            )
+            self.connection.execute("COMMIT")
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM processed_files"
+            ).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
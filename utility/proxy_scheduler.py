@@ -0,0 +1,210 @@
+# -- coding: utf-8 --
+
+import time
+import threading
+
+# Status codes that mean the proxy itself is blocked or throttled
+THROTTLE_STATUS_CODES = (403, 429)
+
+
+class ProxyStats:
+    def __init__(self, proxy, smoothing=0.2):
+        self.proxy = proxy
+        self.smoothing = smoothing
+
+        self.requests = 0
+        self.errors = 0
+        self.status_403 = 0
+        self.status_429 = 0
+
+        # Exponentially weighted so the score follows the proxy's recent health
+        self.latency = None
+        self.error_rate = 0.0
+
+        self.consecutive_failures = 0
+        self.quarantine_count = 0
+        self.quarantined_until = 0.0
+
+        # Smooth weighted round-robin state
+        self.current_weight = 0.0
+
+        # Chosen and not recorded yet
+        self.in_flight = 0
+
+    def _update_latency(self, latency):
+        if latency is None:
+            return
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+    def _update_error_rate(self, failed):
+        self.error_rate += self.smoothing * (float(failed) - self.error_rate)
+
+    def is_quarantined(self, now=None):
+        return self.quarantined_until > (now if now is not None else time.time())
+
+    def score(self, default_latency=1.0):
+        latency = self.latency if self.latency is not None else default_latency
+        return max(0.05, 1.0 - self.error_rate) / max(latency, 0.1)
+
+    def to_dict(self):
+        return {
+            "proxy": f"{self.proxy.host}:{self.proxy.port}",
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "status_403": self.status_403,
+            "status_429": self.status_429,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "score": round(self.score(), 4),
+            "in_flight": self.in_flight,
+            "quarantined": self.is_quarantined(),
+            "quarantined_until": self.quarantined_until,
+        }
+
+
+class ProxyScheduler:
+    """
+    Picks proxies by a health score instead of blind rotation. Every result is
+    fed back through `record`, which tracks latency, error rate and 403/429
+    counts per proxy. Proxies that keep failing are quarantined with an
+    exponentially growing cool-down and the remaining ones are served with
+    smooth weighted round-robin, so equally healthy proxies share traffic
+    evenly and faster ones get proportionally more.
+    """
+
+    def __init__(
+        self,
+        proxies=(),
+        failure_threshold=3,
+        base_cooldown=30.0,
+        max_cooldown=900.0,
+        smoothing=0.2,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.smoothing = smoothing
+
+        # Shared by every worker thread, all reads and updates go through it
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.set_proxies(proxies)
+
+    def set_proxies(self, proxies):
+        with self.lock:
+            self.stats = {
+                id(proxy): ProxyStats(proxy, self.smoothing) for proxy in proxies
+            }
+
+    def add_proxy(self, proxy):
+        with self.lock:
+            self.stats[id(proxy)] = ProxyStats(proxy, self.smoothing)
+
+    def choose(self, exclude=None):
+        """
+        Picks a proxy for one request. Every chosen proxy counts as in flight
+        until its result is passed to `record`.
+        """
+        with self.lock:
+            stats = self._choose(exclude)
+            if stats is None:
+                return None
+            stats.in_flight += 1
+            return stats.proxy
+
+    def _choose(self, exclude):
+        if not self.stats:
+            return None
+
+        now = time.time()
+        excluded = {id(proxy) for proxy in (exclude or [])}
+
+        candidates = [
+            stats
+            for key, stats in self.stats.items()
+            if key not in excluded and not stats.is_quarantined(now)
+        ]
+
+        if not candidates:
+            # Everything is cooling down, fall back to whichever recovers first
+            fallback = [s for k, s in self.stats.items() if k not in excluded]
+            if not fallback:
+                fallback = list(self.stats.values())
+            return min(fallback, key=lambda s: s.quarantined_until)
+
+        # Proxies without measurements yet are scored like an average one
+        latencies = [s.latency for s in candidates if s.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+
+        total_weight = 0.0
+        best = None
+        for stats in candidates:
+            weight = stats.score(default_latency)
+            stats.current_weight += weight
+            total_weight += weight
+            if best is None or stats.current_weight > best.current_weight:
+                best = stats
+
+        best.current_weight -= total_weight
+        return best
+
+    def record(self, proxy, status_code=None, latency=None):
+        """
+        Records the outcome of a request made through `proxy`. A missing
+        status code means the request did not complete at all.
+        """
+        with self.lock:
+            self._record(proxy, status_code, latency)
+
+    def _record(self, proxy, status_code, latency):
+        stats = self.stats.get(id(proxy))
+        if stats is None:
+            return
+
+        if stats.in_flight > 0:
+            stats.in_flight -= 1
+        stats.requests += 1
+        stats._update_latency(latency)
+
+        if status_code == 403:
+            stats.status_403 += 1
+        elif status_code == 429:
+            stats.status_429 += 1
+
+        failed = (
+            status_code is None
+            or status_code in THROTTLE_STATUS_CODES
+            or status_code == 407
+            or status_code >= 500
+        )
+        stats._update_error_rate(failed)
+
+        if not failed:
+            stats.consecutive_failures = 0
+            stats.quarantine_count = 0
+            return
+
+        stats.errors += 1
+        stats.consecutive_failures += 1
+
+        if stats.is_quarantined():
+            # Late results from requests sent before the quarantine started
+            return
+
+        # A proxy that fails again right after its cool-down goes straight back
+        threshold = 1 if stats.quarantine_count > 0 else self.failure_threshold
+        if stats.consecutive_failures >= threshold:
+            cooldown = min(
+                self.max_cooldown, self.base_cooldown * (2**stats.quarantine_count)
+            )
+            stats.quarantined_until = time.time() + cooldown
+            stats.quarantine_count += 1
+            stats.consecutive_failures = 0
+            print(f"Quarantining proxy {stats.proxy.host} for {cooldown:.0f} seconds.")
+
+    def get_stats(self):
+        with self.lock:
+            return [stats.to_dict() for stats in self.stats.values()]
@@ -0,0 +1,79 @@
+# -- coding: utf-8 --
+
+import time
+import threading
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        Takes `tokens` from the bucket and returns how many seconds the caller
+        has to wait before using them. The balance is allowed to go negative,
+        so concurrent callers queue up behind each other instead of racing.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Shared token buckets keyed per host and per proxy. A request has to fit in
+    both budgets, so the aggregate rate against a host stays bounded no
+    matter how many workers or proxies are active.
+    """
+
+    def __init__(self, host_rate=None, proxy_rate=None, host_rates=None, burst=None):
+        self.host_rate = host_rate
+        self.proxy_rate = proxy_rate
+        self.host_rates = host_rates or {}
+        self.burst = burst
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, key, rate):
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            return bucket
+
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, self.burst)
+                self.buckets[key] = bucket
+
+        return bucket
+
+    def reserve(self, host=None, proxy_key=None):
+        delay = 0.0
+
+        host_rate = self.host_rates.get(host, self.host_rate)
+        if host is not None and host_rate:
+            delay = max(delay, self._get_bucket(("host", host), host_rate).reserve())
+
+        if proxy_key is not None and self.proxy_rate:
+            bucket = self._get_bucket(("proxy", proxy_key), self.proxy_rate)
+            delay = max(delay, bucket.reserve())
+
+        return delay
+
+    def acquire(self, host=None, proxy_key=None):
+        delay = self.reserve(host, proxy_key)
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,257 @@
+# -- coding: utf-8 --
+
+import os
+import re
+import glob
+import gzip
+import json
+import hashlib
+
+# "json" is the indented array format the pipeline used to write, it can
+# still be read and written but has to be loaded whole
+RECORD_FORMATS = ["jsonl", "jsonl.gz", "json"]
+DEFAULT_RECORD_FORMAT = "jsonl"
+
+# One JSON line per finished batch, the name does not match the record globs
+BATCH_MANIFEST_NAME = "batches.manifest"
+BATCH_NAME_PATTERN = re.compile(r"^batch-(\d+)\.")
+
+
+def get_record_format(path):
+    for record_format in RECORD_FORMATS:
+        if path.endswith(f".{record_format}"):
+            return record_format
+    raise ValueError(f"Unknown record format for {path}")
+
+
+def get_record_extension(record_format):
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(f"Unknown record format: {record_format}")
+    return f".{record_format}"
+
+
+def open_record_file(path, mode="r"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class RecordWriter:
+    """
+    Writes dict records one at a time. JSON lines are written as they come,
+    the legacy array format is streamed element by element as well.
+
+    With `atomic` the records go to a hidden temporary file next to `path`
+    that is only renamed into place on close, so readers never see a half
+    written file.
+    """
+
+    def __init__(self, path, atomic=False):
+        self.path = path
+        self.record_format = get_record_format(path)
+        self.count = 0
+
+        self.temp_path = None
+        if atomic:
+            directory, name = os.path.split(path)
+            self.temp_path = os.path.join(directory, f".tmp-{name}")
+
+        self.file = open_record_file(self.temp_path or path, "w")
+
+        if self.record_format == "json":
+            self.file.write("[")
+
+    def write(self, record):
+        if self.record_format == "json":
+            self.file.write(",\n" if self.count else "\n")
+            self.file.write(json.dumps(record, ensure_ascii=False))
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False))
+            self.file.write("\n")
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.record_format == "json":
+            self.file.write("\n]")
+        self.file.close()
+
+        if self.temp_path:
+            os.replace(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BatchedRecordWriter:
+    """
+    Streams records into batch files of at most `batch_size` records each,
+    starting a new file whenever the current one is full.
+
+    Batches are numbered batch-000001, batch-000002, ... continuing from the
+    batches already in the directory, and each one is written atomically.
+    Every finished batch is appended to the batch manifest together with its
+    record count and SHA-256, so readers can verify the directory is complete
+    without rescanning the records.
+    """
+
+    def __init__(self, output_dir, batch_size, record_format=DEFAULT_RECORD_FORMAT):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.extension = get_record_extension(record_format)
+        self.writer = None
+        self.paths = []
+        # Records written in total and records in finished batches
+        self.count = 0
+        self.finished_count = 0
+
+        self.manifest_path = os.path.join(output_dir, BATCH_MANIFEST_NAME)
+        self.sequence = self._last_sequence()
+
+        # Called with the writer after every finished batch
+        self.batch_callbacks = []
+
+    def _last_sequence(self):
+        sequences = [entry["sequence"] for entry in read_batch_manifest(self.output_dir)]
+        for name in os.listdir(self.output_dir):
+            match = BATCH_NAME_PATTERN.match(name)
+            # Timestamp named batches of older runs are not part of the sequence
+            if match and len(match.group(1)) < 14:
+                sequences.append(int(match.group(1)))
+        return max(sequences, default=0)
+
+    def _next_batch_path(self):
+        self.sequence += 1
+        return os.path.join(
+            self.output_dir, f"batch-{self.sequence:06d}{self.extension}"
+        )
+
+    def _finish_batch(self):
+        self.writer.close()
+
+        entry = {
+            "file": os.path.basename(self.writer.path),
+            "sequence": self.sequence,
+            "records": self.writer.count,
+            "bytes": os.path.getsize(self.writer.path),
+            "sha256": file_sha256(self.writer.path),
+        }
+        with open(self.manifest_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry))
+            file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.finished_count += self.writer.count
+        self.writer = None
+
+        for callback in self.batch_callbacks:
+            callback(self)
+
+    def add_batch_callback(self, callback):
+        if callback not in self.batch_callbacks:
+            self.batch_callbacks.append(callback)
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = RecordWriter(self._next_batch_path(), atomic=True)
+            self.paths.append(self.writer.path)
+
+        self.writer.write(record)
+        self.count += 1
+
+        if self.writer.count >= self.batch_size:
+            self._finish_batch()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self.writer is not None:
+            self._finish_batch()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_records(path, records):
+    with RecordWriter(path) as writer:
+        writer.write_many(records)
+        return writer.count
+
+
+def iter_records(path):
+    """Yields the records of a file one at a time."""
+    if get_record_format(path) == "json":
+        with open_record_file(path) as file:
+            yield from json.load(file)
+        return
+
+    with open_record_file(path) as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_batch_manifest(dir_path):
+    manifest_path = os.path.join(dir_path, BATCH_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return []
+
+    entries = []
+    with open(manifest_path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def verify_batches(dir_path, check_hashes=True):
+    """
+    Checks the batches listed in the manifest of a directory against the
+    files on disk and returns the names of the missing or damaged ones.
+    """
+    invalid = []
+    for entry in read_batch_manifest(dir_path):
+        path = os.path.join(dir_path, entry["file"])
+        if (
+            not os.path.exists(path)
+            or os.path.getsize(path) != entry["bytes"]
+            or (check_hashes and file_sha256(path) != entry["sha256"])
+        ):
+            invalid.append(entry["file"])
+    return invalid
+
+
+def list_record_files(dir_path):
+    filepaths = []
+    for record_format in RECORD_FORMATS:
+        filepaths.extend(glob.glob(os.path.join(dir_path, f"*.{record_format}")))
+    return sorted(filepaths)
+
+
+def iter_records_in_dir(dir_path):
+    for filepath in list_record_files(dir_path):
+        yield from iter_records(filepath)
@@ -1,8 +1,17 @@
 # -- coding: utf-8 --
 
 import json
+import time
+import threading
 import requests
 
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+from utility.proxy_scheduler import ProxyScheduler
+from utility.rate_limiter import RateLimiter
+from utility.http_cache import HTTPCache, LRUEviction, TTLEviction
+
 class SingletonMeta(type):
     _instances = {}
 
@@ -22,19 +31,124 @@ class Proxy:
     def __repr__(self):
         return f"Proxy(host={self.host}, port={self.port}, user={self.user}, password={self.password})"
 
+    def to_url(self):
+        return f"http://{self.user}:{self.password}@{self.host}:{self.port}"
+
 class RequestTool(metaclass=SingletonMeta):
     def __init__(self):
         self.proxies = []
-        self.last_proxy_index = -1
+        self.last_proxy = None
+        self.scheduler = ProxyScheduler()
+        self.rate_limiter = None
+        self.http_cache = None
+
+        # One keep-alive session per proxy, so worker threads reuse warm
+        # connections instead of reconnecting through the proxy every time
+        self.pool_connections = 10
+        self.pool_maxsize = 20
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def configure_pool(self, pool_connections=None, pool_maxsize=None):
+        if pool_connections is not None:
+            self.pool_connections = pool_connections
+        if pool_maxsize is not None:
+            self.pool_maxsize = pool_maxsize
+
+        # Sessions created with the old sizes are rebuilt on next use
+        self.close_sessions()
+
+    def configure_rate_limit(
+        self, host_rate=None, proxy_rate=None, host_rates=None, burst=None
+    ):
+        """Rates are requests per second, None leaves that budget unlimited."""
+        if host_rate or proxy_rate or host_rates:
+            self.rate_limiter = RateLimiter(host_rate, proxy_rate, host_rates, burst)
+        else:
+            self.rate_limiter = None
+
+    def configure_cache(self, directory=None, max_bytes=None, ttl=None):
+        """
+        Caches responses that carry validators under `directory` and
+        revalidates them with conditional requests. `max_bytes` bounds the
+        cache with LRU eviction, `ttl` drops entries older than that many
+        seconds. Without a directory caching is turned off.
+        """
+        if self.http_cache is not None:
+            self.http_cache.close()
+            self.http_cache = None
+
+        if directory is None:
+            return
+
+        policies = []
+        if ttl:
+            policies.append(TTLEviction(ttl))
+        if max_bytes:
+            policies.append(LRUEviction(max_bytes))
+        self.http_cache = HTTPCache(directory, policies)
+
+    def rate_limit_delay(self, url, proxy=None):
+        """Reserves a request slot and returns the seconds to wait before sending."""
+        if self.rate_limiter is None:
+            return 0.0
+
+        proxy_key = proxy.to_url() if proxy is not None else None
+        return self.rate_limiter.reserve(urlsplit(url).hostname, proxy_key)
+
+    def _wait_for_rate_limit(self, url, proxy=None):
+        delay = self.rate_limit_delay(url, proxy)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _create_session(self, proxy_url=None):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        if proxy_url:
+            ### Be careful
+            ### Both http and https are set to http
+            ### This is because the proxy is not https
+            ### If you are using an https proxy, change it to https
+            session.proxies = {"http": proxy_url, "https": proxy_url}
+            # Otherwise HTTP(S)_PROXY from the environment wins over
+            # session.proxies and the request bypasses the chosen proxy
+            session.trust_env = False
+
+        return session
+
+    def get_session(self, proxy=None):
+        key = proxy.to_url() if proxy is not None else None
+
+        session = self.sessions.get(key)
+        if session is not None:
+            return session
+
+        with self.sessions_lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self._create_session(key)
+                self.sessions[key] = session
+
+        return session
+
+    def close_sessions(self):
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
 
     def add_proxy(self, proxy):
         self.proxies.append(proxy)
-        self.last_proxy_index += 1
+        self.scheduler.add_proxy(proxy)
 
     def get_last_proxy(self):
-        if self.last_proxy_index >= 0:
-            return self.proxies[self.last_proxy_index]
-        return None
+        return self.last_proxy
 
     def read_from_proxy_file(self, filename):
         try:
@@ -47,6 +161,7 @@ class RequestTool(metaclass=SingletonMeta):
             return []
 
         self.proxies = []  # Resetting the list
+        self.close_sessions()
         try:
             for p in proxy_data:
                 proxy_obj = Proxy(p['host'], p['port'], p['user'], p['pass'])
@@ -54,50 +169,75 @@ class RequestTool(metaclass=SingletonMeta):
         except KeyError as e:
             print(f"Error: Missing key in proxy data: {e}")
             self.proxies = []  # Resetting the list in case of error
+            self.scheduler.set_proxies([])
             return []
 
+        self.scheduler.set_proxies(self.proxies)
         return self.proxies
 
-    def get_proxy(self):
+    def get_proxy(self, exclude=None):
         if len(self.proxies) == 0:
             print("Error: No proxies loaded.")
             return None
 
-        proxy = self.proxies[self.last_proxy_index]
-        self.last_proxy_index += 1
-        if self.last_proxy_index >= len(self.proxies):
-            self.last_proxy_index = 0
+        proxy = self.scheduler.choose(exclude)
+        self.last_proxy = proxy
 
         return proxy
 
+    def report(self, proxy, status_code=None, latency=None):
+        """Feeds the outcome of a request back into the proxy scheduler."""
+        self.scheduler.record(proxy, status_code, latency)
 
-    def get(self, url, **kwargs ):
+    def get_proxy_stats(self):
+        return self.scheduler.get_stats()
 
-        if len(self.proxies) == 0:
+    def get(self, url, proxy=None, **kwargs):
+        # Streamed bodies are consumed by the caller, they are never cached
+        if self.http_cache is None or kwargs.get("stream"):
+            return self._get(url, proxy, **kwargs)
+
+        entry = self.http_cache.get(url)
+        if entry is not None:
+            headers = dict(kwargs.get("headers") or {})
+            headers.update(self.http_cache.validators(entry))
+            kwargs["headers"] = headers
+
+        response = self._get(url, proxy, **kwargs)
+        if response is None:
+            return None
+
+        if response.status_code == 304 and entry is not None:
+            return self.http_cache.revalidated(entry, response)
+
+        self.http_cache.store(url, response)
+        return response
+
+    def _get(self, url, proxy=None, **kwargs):
+        if proxy is None and len(self.proxies) == 0:
             print("No proxies available, making a direct request.")
-            return requests.get(url, **kwargs)
+            self._wait_for_rate_limit(url)
+            return self.get_session().get(url, **kwargs)
 
-        proxy = self.get_proxy()
+        if proxy is None:
+            proxy = self.get_proxy()
         if proxy is None:
             print("Failed to retrieve a proxy, making a direct request.")
-            return requests.get(url, **kwargs)
-
+            self._wait_for_rate_limit(url)
+            return self.get_session().get(url, **kwargs)
 
-        ### Be careful
-        ### Both http and https are set to http
-        ### This is because the proxy is not https
-        ### If you are using an https proxy, change it to https
-        proxies = {
-            "http": f"http://{proxy.user}:{proxy.password}@{proxy.host}:{proxy.port}",
-            "https": f"http://{proxy.user}:{proxy.password}@{proxy.host}:{proxy.port}"
-        }
+        self._wait_for_rate_limit(url, proxy)
 
+        start_time = time.time()
         try:
-            response = requests.get(url, proxies=proxies, **kwargs)
+            response = self.get_session(proxy).get(url, **kwargs)
+            self.report(proxy, response.status_code, time.time() - start_time)
             return response
         except requests.exceptions.RequestException:
             print("Request Exception while while fetching", url)
+            self.report(proxy, None, time.time() - start_time)
             return None
         except Exception as e:
             print(f"Unaccounted exception while fetching {url}")
-            return None
\ No newline at end of file
+            self.report(proxy, None, time.time() - start_time)
+            return None
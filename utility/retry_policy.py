@@ -0,0 +1,59 @@
+# -- coding: utf-8 --
+
+import time
+import random
+
+from email.utils import parsedate_to_datetime
+
+# Retrying these only wastes a request, the answer will not change
+PERMANENT_STATUS_CODES = (400, 401, 404, 405, 410, 414, 451)
+
+
+def parse_retry_after(value):
+    """Returns the Retry-After header value in seconds, or None if unusable."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=60.0,
+        permanent_status_codes=PERMANENT_STATUS_CODES,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.permanent_status_codes = permanent_status_codes
+
+    def should_retry(self, failed_attempts, status_code=None):
+        if status_code in self.permanent_status_codes:
+            return False
+        return failed_attempts <= self.max_retries
+
+    def get_delay(self, failed_attempts, retry_after=None):
+        """
+        Exponential backoff with jitter: the n-th retry waits between half and
+        all of backoff * 2^(n-1), capped at max_backoff. A Retry-After from the
+        server is treated as a lower bound.
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** (failed_attempts - 1)))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        return delay
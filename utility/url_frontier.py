@@ -0,0 +1,170 @@
+# -- coding: utf-8 --
+
+import time
+import sqlite3
+import itertools
+import threading
+
+STATE_QUEUED = "queued"
+STATE_FETCHED = "fetched"
+STATE_FAILED = "failed"
+
+# The queues the pipeline stages hand urls over in
+QUEUE_SEARCH = "search"
+QUEUE_INFO = "info"
+QUEUE_DOWNLOAD = "download"
+
+
+class URLFrontier:
+    """
+    Persistent set of the urls every stage of the pipeline has produced,
+    split into named queues, each url with a state (queued, fetched, failed)
+    and a priority. Stored in SQLite, duplicates are dropped by the unique
+    key as they are inserted, so nothing has to be loaded when the frontier
+    is opened. Consumers page through the queued urls instead of rereading
+    url list files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                queue TEXT NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                added_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (queue, url)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS urls_queued"
+            " ON urls (queue, state, priority DESC)"
+        )
+
+    def __contains__(self, queue_url):
+        queue, url = queue_url
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM urls WHERE queue = ? AND url = ?", (queue, url)
+            ).fetchone()
+        return row is not None
+
+    def add(self, url, queue, priority=0):
+        return self.add_many([url], queue, priority) == 1
+
+    def add_many(self, urls, queue, priority=0, batch_size=10000):
+        """Queues the urls not seen before in `queue`, returns how many."""
+        urls = iter(urls)
+        added = 0
+        while True:
+            batch = list(itertools.islice(urls, batch_size))
+            if not batch:
+                return added
+            added += self._add_batch(batch, queue, priority)
+
+    def _add_batch(self, urls, queue, priority):
+        now = time.time()
+        rows = [(queue, url, STATE_QUEUED, priority, now, now) for url in urls]
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            added = self.connection.executemany(
+                "INSERT OR IGNORE INTO urls"
+                " (queue, url, state, priority, added_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            ).rowcount
+            self.connection.execute("COMMIT")
+
+        return added
+
+    def iter_queued(self, queue, batch_size=1000):
+        """
+        Yields the queued urls of `queue`, highest priority first, reading
+        them a page at a time. Urls marked while iterating are not repeated.
+        """
+        last_priority = None
+        last_rowid = None
+        while True:
+            with self.lock:
+                if last_rowid is None:
+                    rows = self.connection.execute(
+                        "SELECT rowid, url, priority FROM urls"
+                        " WHERE queue = ? AND state = ?"
+                        " ORDER BY priority DESC, rowid LIMIT ?",
+                        (queue, STATE_QUEUED, batch_size),
+                    ).fetchall()
+                else:
+                    rows = self.connection.execute(
+                        "SELECT rowid, url, priority FROM urls"
+                        " WHERE queue = ? AND state = ?"
+                        " AND (priority < ? OR (priority = ? AND rowid > ?))"
+                        " ORDER BY priority DESC, rowid LIMIT ?",
+                        (
+                            queue,
+                            STATE_QUEUED,
+                            last_priority,
+                            last_priority,
+                            last_rowid,
+                            batch_size,
+                        ),
+                    ).fetchall()
+
+            if not rows:
+                return
+
+            for _, url, _ in rows:
+                yield url
+
+            last_rowid, _, last_priority = rows[-1]
+
+    def _set_state(self, url, queue, state):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE urls SET state = ?, attempts = attempts + 1,"
+                " updated_at = ? WHERE queue = ? AND url = ?",
+                (state, time.time(), queue, url),
+            )
+
+    def mark_fetched(self, url, queue):
+        self._set_state(url, queue, STATE_FETCHED)
+
+    def mark_failed(self, url, queue):
+        self._set_state(url, queue, STATE_FAILED)
+
+    def requeue_failed(self, queue):
+        with self.lock:
+            return self.connection.execute(
+                "UPDATE urls SET state = ?, updated_at = ?"
+                " WHERE queue = ? AND state = ?",
+                (STATE_QUEUED, time.time(), queue, STATE_FAILED),
+            ).rowcount
+
+    def count(self, queue, state=None):
+        with self.lock:
+            if state is None:
+                row = self.connection.execute(
+                    "SELECT COUNT(*) FROM urls WHERE queue = ?", (queue,)
+                )
+            else:
+                row = self.connection.execute(
+                    "SELECT COUNT(*) FROM urls WHERE queue = ? AND state = ?",
+                    (queue, state),
+                )
+            return row.fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()